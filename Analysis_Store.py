@@ -0,0 +1,206 @@
+import datetime
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+# Columns of an analysed post, in the order of the Excel output
+ANALYSIS_COLUMNS = [
+    'thread_title', 'post_author', 'post_date', 'thread_url', 'post_content', 'sentiment', 'emotions', 'emotion_score',
+    'questions', 'technical_issues', 'technical_issue_keywords', 'country', 'iMOW_models', 'solution', 'replaced',
+    'feature_request', 'comparison', 'complaints', 'duplicate_of'
+]
+
+# Groups of the rollup table, one row per combination that occurs, with the number of posts and the sum of
+# their emotion scores (the average emotion score of a group is emotion_score_sum / posts)
+ROLLUP_DIMENSIONS = ['iMOW_model', 'week', 'sentiment', 'emotion', 'technical_issue', 'feature_request']
+
+
+# Monday of the week of a post date ('2024-03-08T16:00:00+0100', a datetime from Excel, ...), '' if unknown
+def week_start(post_date):
+    try:
+        if hasattr(post_date, 'date'):
+            day = post_date.date()
+        else:
+            day = datetime.date.fromisoformat(str(post_date)[:10])
+        return (day - datetime.timedelta(days=day.weekday())).isoformat()
+    except (TypeError, ValueError):
+        # Empty cells, NaN and NaT
+        return ''
+
+
+# Function to add a row's contribution to the rollup deltas, sign -1 takes it away
+# A post with several models or technical issues counts once in the group of each of them
+def add_rollup_deltas(deltas, row, sign=1):
+    models = [model for model in (row.get('iMOW_models') or '').split(', ') if model] or ['none']
+    issues = [issue for issue in (row.get('technical_issues') or '').split(', ') if issue] or ['none']
+    week = week_start(row.get('post_date'))
+    score = float(row.get('emotion_score') or 0.0)
+    for model in set(models):
+        for issue in set(issues):
+            key = (model, week, row.get('sentiment') or '', row.get('emotions') or '', issue,
+                   row.get('feature_request') or '')
+            totals = deltas.setdefault(key, [0, 0.0])
+            totals[0] += sign
+            totals[1] += sign * score
+
+
+# Rollup of result rows that are not in a store (the --excel mode), in the layout of the rollup table
+def rollup_frame(rows):
+    deltas = {}
+    for row in rows:
+        add_rollup_deltas(deltas, row)
+    return pd.DataFrame([key + tuple(totals) for key, totals in sorted(deltas.items())],
+                        columns=ROLLUP_DIMENSIONS + ['posts', 'emotion_score_sum'])
+
+
+# File the rollup of a results workbook goes to, "NLP Analysis Rollup.xlsx" for "NLP Analysis.xlsx"
+def rollup_file_name(file_name):
+    root, extension = os.path.splitext(file_name)
+    return f'{root} Rollup{extension}'
+
+
+# Function to write a data frame to a workbook, retrying while the file is open in Excel
+def write_excel(df, file_name, attempts=5):
+    for attempt in range(attempts):
+        try:
+            df.to_excel(file_name, index=False)
+            return True
+        except PermissionError:
+            if attempt == attempts - 1:
+                logging.error(f"Unable to save {file_name} because the file is open. Giving up, run the export again later.")
+                return False
+            logging.warning(f"Unable to save {file_name} because the file is open. Retrying in 20 seconds...")
+            time.sleep(20)
+
+
+# SQLite store of the NLP results, with the offset each consumer of the crawl store has committed
+#
+# Results are keyed by the id of the post in the crawl store. A batch of results and the id of the last post
+# it covers are committed in one transaction, so after a crash or restart the consumer continues right after
+# the last committed batch and every post ends up in the store exactly once.
+#
+# The rollup table keeps the counts of the dashboard (see ROLLUP_DIMENSIONS) up to date: every batch adds
+# its posts to their groups in the same transaction, and takes away the old results of posts it replaces.
+class AnalysisStore:
+    def __init__(self, file_name='nlp_store.sqlite'):
+        self.file_name = file_name
+        self.conn = sqlite3.connect(file_name, timeout=30)
+        columns = ', '.join(f'"{column}"' for column in ANALYSIS_COLUMNS)
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS analysis (post_id INTEGER PRIMARY KEY, {columns})')
+        # Stores created before a column was added get it, empty for the rows already there
+        existing_columns = {row[1] for row in self.conn.execute('PRAGMA table_info(analysis)')}
+        for column in ANALYSIS_COLUMNS:
+            if column not in existing_columns:
+                self.conn.execute(f'ALTER TABLE analysis ADD COLUMN "{column}"')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS offsets (consumer TEXT PRIMARY KEY, last_id INTEGER NOT NULL)')
+        has_rollup = self.conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'rollup'").fetchone()[0]
+        dimensions = ', '.join(f'"{dimension}"' for dimension in ROLLUP_DIMENSIONS)
+        definitions = ', '.join(f'"{dimension}" TEXT NOT NULL' for dimension in ROLLUP_DIMENSIONS)
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS rollup ({definitions}, posts INTEGER NOT NULL, '
+                          f'emotion_score_sum REAL NOT NULL, PRIMARY KEY ({dimensions}))')
+        self.conn.commit()
+        # Stores from before the rollup get it computed once from the results they hold
+        if not has_rollup and self.row_count():
+            self.rebuild_rollup()
+
+    def close(self):
+        self.conn.close()
+
+    # Id of the last post the consumer committed, 0 before its first batch
+    def offset(self, consumer='nlp'):
+        row = self.conn.execute('SELECT last_id FROM offsets WHERE consumer = ?', (consumer,)).fetchone()
+        return row[0] if row else 0
+
+    # Writes the results of a batch (dicts with 'post_id') and moves the offset to last_id, all or nothing
+    # Without last_id no offset moves, for re-analyses of posts the consumer has already passed
+    def commit_batch(self, rows, last_id=None, consumer='nlp'):
+        columns = ', '.join(f'"{column}"' for column in ['post_id'] + ANALYSIS_COLUMNS)
+        placeholders = ', '.join('?' * (len(ANALYSIS_COLUMNS) + 1))
+        with self.conn:
+            deltas = {}
+            for old_row in self.rows([row['post_id'] for row in rows]):
+                add_rollup_deltas(deltas, old_row, -1)
+            for row in rows:
+                add_rollup_deltas(deltas, row)
+            self.apply_rollup_deltas(deltas)
+            self.conn.executemany(
+                f'INSERT OR REPLACE INTO analysis ({columns}) VALUES ({placeholders})',
+                [tuple(row.get(column) for column in ['post_id'] + ANALYSIS_COLUMNS) for row in rows]
+            )
+            if last_id is not None:
+                self.conn.execute(
+                    'INSERT INTO offsets (consumer, last_id) VALUES (?, ?) '
+                    'ON CONFLICT (consumer) DO UPDATE SET last_id = excluded.last_id',
+                    (consumer, last_id)
+                )
+
+    # Stored results of the given posts, as dicts
+    def rows(self, post_ids):
+        columns = ', '.join(f'"{column}"' for column in ANALYSIS_COLUMNS)
+        rows = []
+        for start in range(0, len(post_ids), 500):
+            chunk = post_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = self.conn.execute(f'SELECT {columns} FROM analysis WHERE post_id IN ({placeholders})', chunk)
+            rows.extend(dict(zip(ANALYSIS_COLUMNS, row)) for row in cursor)
+        return rows
+
+    # Adds the deltas to their groups; groups that no post is left in are dropped, which only a batch that
+    # replaces results can cause
+    def apply_rollup_deltas(self, deltas):
+        dimensions = ', '.join(f'"{dimension}"' for dimension in ROLLUP_DIMENSIONS)
+        placeholders = ', '.join('?' * (len(ROLLUP_DIMENSIONS) + 2))
+        self.conn.executemany(
+            f'INSERT INTO rollup ({dimensions}, posts, emotion_score_sum) VALUES ({placeholders}) '
+            f'ON CONFLICT ({dimensions}) DO UPDATE SET posts = posts + excluded.posts, '
+            f'emotion_score_sum = emotion_score_sum + excluded.emotion_score_sum',
+            [key + (posts, score) for key, (posts, score) in deltas.items() if posts or score]
+        )
+        if any(posts < 0 for posts, _ in deltas.values()):
+            self.conn.execute('DELETE FROM rollup WHERE posts <= 0')
+
+    # Computes the rollup from every stored result, for stores from before it and as a check of the deltas
+    def rebuild_rollup(self):
+        columns = ', '.join(f'"{column}"' for column in ANALYSIS_COLUMNS)
+        deltas = {}
+        for row in self.conn.execute(f'SELECT {columns} FROM analysis'):
+            add_rollup_deltas(deltas, dict(zip(ANALYSIS_COLUMNS, row)))
+        with self.conn:
+            self.conn.execute('DELETE FROM rollup')
+            self.apply_rollup_deltas(deltas)
+
+    def row_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM analysis').fetchone()[0]
+
+    # On-demand export of the workbooks the dashboard reads: the results, and the rollup next to them
+    # ("NLP Analysis Rollup.xlsx" for "NLP Analysis.xlsx"), which costs the same however many posts there are
+    def export_excel(self, file_name='NLP Analysis.xlsx', attempts=5):
+        columns = ', '.join(f'"{column}"' for column in ANALYSIS_COLUMNS)
+        df = pd.read_sql_query(f'SELECT {columns} FROM analysis ORDER BY post_id', self.conn)
+        if not write_excel(df, file_name, attempts):
+            return False
+        logging.info(f"Exported {len(df)} rows to {file_name}")
+        return self.export_rollup(file_name, attempts)
+
+    def export_rollup(self, file_name='NLP Analysis.xlsx', attempts=5):
+        rollup_file = rollup_file_name(file_name)
+        dimensions = ', '.join(f'"{dimension}"' for dimension in ROLLUP_DIMENSIONS)
+        df = pd.read_sql_query(f'SELECT {dimensions}, posts, emotion_score_sum FROM rollup ORDER BY {dimensions}',
+                               self.conn)
+        if not write_excel(df, rollup_file, attempts):
+            return False
+        logging.info(f"Exported {len(df)} rollup groups to {rollup_file}")
+        return True
+
+
+if __name__ == '__main__':
+    # python Analysis_Store.py [store file] exports NLP Analysis.xlsx for the dashboard
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = AnalysisStore(sys.argv[1] if len(sys.argv) > 1 else 'nlp_store.sqlite')
+    store.export_excel()
+    store.close()
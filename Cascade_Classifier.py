@@ -0,0 +1,199 @@
+import hashlib
+import logging
+import pickle
+import random
+import threading
+import time
+
+import numpy as np
+
+
+# Labels of a zero-shot result above the threshold, the decision categorize_comments takes from it
+def decided_labels(result, threshold=0.3):
+    return frozenset(label for label, score in zip(result['labels'], result['scores']) if score > threshold)
+
+
+# First tier of the cascade: TF-IDF features and one logistic regression per label, trained to reproduce the
+# decisions the zero-shot model took for the posts in the inference cache. Needs scikit-learn.
+class FastClassifier:
+    def __init__(self, labels, threshold=0.3):
+        self.labels = list(labels)
+        self.threshold = threshold
+        self.vectorizer = None
+        self.heads = []
+
+    def fit(self, texts, results):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        self.vectorizer = TfidfVectorizer(ngram_range=(1, 2), min_df=2, sublinear_tf=True, max_features=200000)
+        features = self.vectorizer.fit_transform(texts)
+        decisions = [decided_labels(result, self.threshold) for result in results]
+        self.heads = []
+        for label in self.labels:
+            targets = np.array([label in decided for decided in decisions])
+            if targets.all() or not targets.any():
+                # Nothing to learn, the label always gets the one answer it had
+                self.heads.append(float(targets.any()))
+            else:
+                self.heads.append(LogisticRegression(C=4.0, max_iter=1000).fit(features, targets))
+        return self
+
+    # Probability of every label for every text, shape (texts, labels)
+    def predict_proba(self, texts):
+        features = self.vectorizer.transform(texts)
+        columns = []
+        for head in self.heads:
+            if isinstance(head, float):
+                columns.append(np.full(len(texts), head))
+            else:
+                columns.append(head.predict_proba(features)[:, 1])
+        return np.column_stack(columns) if columns else np.zeros((len(texts), 0))
+
+    def save(self, file_name):
+        with open(file_name, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(file_name):
+        with open(file_name, 'rb') as f:
+            return pickle.load(f)
+
+
+# Trains a FastClassifier on texts with their zero-shot results and checks it on a held-out share of them
+#
+# Returns the classifier and the held-out figures: the share of posts the fast tier would answer (coverage)
+# and how often its labels equal the zero-shot labels on those posts (agreement).
+def train_fast_classifier(texts, results, labels, threshold=0.3, confidence=0.9, max_chars=1000, test_share=0.2,
+                          seed=0):
+    order = list(range(len(texts)))
+    random.Random(seed).shuffle(order)
+    test_size = int(len(order) * test_share)
+    test, train = order[:test_size], order[test_size:]
+
+    classifier = FastClassifier(labels, threshold).fit([texts[i] for i in train], [results[i] for i in train])
+
+    evaluation = {'train_posts': len(train), 'test_posts': len(test), 'coverage': 0.0, 'agreement': None}
+    if test:
+        test_texts = [texts[i] for i in test]
+        probabilities = classifier.predict_proba(test_texts)
+        answered = agreed = 0
+        for text, row, index in zip(test_texts, probabilities, test):
+            if is_confident(text, row, confidence, max_chars):
+                answered += 1
+                agreed += decided_labels(fast_result(labels, row), threshold) == decided_labels(results[index], threshold)
+        evaluation['coverage'] = round(answered / len(test), 4)
+        evaluation['agreement'] = round(agreed / answered, 4) if answered else None
+    # Training everything the second time round gives the model that is saved
+    classifier.fit(texts, results)
+    return classifier, evaluation
+
+
+# A post goes to the fast tier when it is short enough and every label is clearly on one side
+def is_confident(text, probabilities, confidence, max_chars):
+    return len(text) <= max_chars and bool(np.all(np.maximum(probabilities, 1 - probabilities) >= confidence))
+
+
+# Fast tier answer in the format of a zero-shot result, highest probability first
+def fast_result(labels, probabilities):
+    order = np.argsort(-probabilities, kind='stable')
+    return {'labels': [labels[i] for i in order], 'scores': [float(probabilities[i]) for i in order]}
+
+
+# Whether a confident post is audited: the first 8 bytes of its SHA-256 read as a fraction below audit_rate
+def is_audited(text, audit_rate):
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64 < audit_rate
+
+
+# Zero-shot classification in two tiers
+#
+# Posts go to the FastClassifier first. Those it is sure about (see is_confident) keep its answer, the others
+# go to large(texts), the zero-shot model. A confidence of at least 0.7 keeps the fast probabilities on the
+# same side of the 0.3 threshold as the fast decision.
+#
+# An audit_rate share of the confident posts also goes to the large model, which gives the agreement rate of
+# the fast tier while it runs; those posts keep the large model's answer. Which posts are audited follows
+# from a hash of their text (see is_audited), so repeated runs give the same labels whatever the batches and
+# processes. The speedup compares the time spent with the time the large model alone would have needed at
+# its measured cost per post.
+class Cascade:
+    def __init__(self, fast, large, confidence=0.9, max_chars=1000, audit_rate=0.05):
+        self.fast = fast
+        self.large = large
+        self.confidence = confidence
+        self.max_chars = max_chars
+        self.audit_rate = audit_rate
+        self.lock = threading.Lock()
+        self.posts = 0
+        self.fast_posts = 0
+        self.large_posts = 0
+        self.audited = 0
+        self.agreed = 0
+        self.fast_seconds = 0.0
+        self.large_seconds = 0.0
+
+    def zero_shot(self, texts):
+        if not texts:
+            return []
+        start = time.perf_counter()
+        probabilities = self.fast.predict_proba(texts)
+        fast_seconds = time.perf_counter() - start
+
+        results = [None] * len(texts)
+        large_indices = []
+        audited = []
+        for index, (text, row) in enumerate(zip(texts, probabilities)):
+            if not is_confident(text, row, self.confidence, self.max_chars):
+                large_indices.append(index)
+                continue
+            results[index] = fast_result(self.fast.labels, row)
+            if is_audited(text, self.audit_rate):
+                large_indices.append(index)
+                audited.append(index)
+
+        start = time.perf_counter()
+        large_results = self.large([texts[index] for index in large_indices]) if large_indices else []
+        large_seconds = time.perf_counter() - start
+
+        agreed = 0
+        audited_set = set(audited)
+        for index, result in zip(large_indices, large_results):
+            if index in audited_set:
+                agreed += decided_labels(results[index], self.fast.threshold) == \
+                    decided_labels(result, self.fast.threshold)
+            results[index] = result
+
+        with self.lock:
+            self.posts += len(texts)
+            # Audited posts keep the large model's answer, so they count as its posts
+            self.large_posts += len(large_indices)
+            self.fast_posts += len(texts) - len(large_indices)
+            self.audited += len(audited)
+            self.agreed += agreed
+            self.fast_seconds += fast_seconds
+            self.large_seconds += large_seconds
+        return results
+
+    # Totals since the cascade was loaded
+    def report(self):
+        with self.lock:
+            seconds = self.fast_seconds + self.large_seconds
+            speedup = None
+            if self.large_posts and seconds > 0:
+                speedup = round(self.posts * (self.large_seconds / self.large_posts) / seconds, 2)
+            return {
+                'posts': self.posts,
+                'fast_posts': self.fast_posts,
+                'large_posts': self.large_posts,
+                'fast_share': round(self.fast_posts / self.posts, 4) if self.posts else 0.0,
+                'audited': self.audited,
+                'agreement': round(self.agreed / self.audited, 4) if self.audited else None,
+                'speedup': speedup,
+            }
+
+    def log_report(self):
+        report = self.report()
+        logging.info(f"Cascade: {report['posts']} posts, {report['fast_share']:.0%} answered by the fast tier, "
+                     f"agreement {report['agreement']} on {report['audited']} audited, speedup {report['speedup']}x")
+        return report
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Status codes that are worth another attempt after backing off
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Token bucket that spaces out the requests sent to a single host
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        waited = 0.0
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.updated:
+                    # The host asked us to back off, nobody gets a token until then
+                    delay = self.updated - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def pause(self, seconds):
+        self.tokens = 0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+# In-process LRU cache of fetched pages keyed by URL, bounded by entries and bytes
+class PageCache:
+    def __init__(self, max_entries=128, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.pages = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, url):
+        return url in self.pages
+
+    def get(self, url):
+        text = self.pages.get(url)
+        if text is None:
+            self.misses += 1
+            return None
+        self.pages.move_to_end(url)
+        self.hits += 1
+        return text
+
+    def put(self, url, text):
+        if url in self.pages:
+            self.size -= len(self.pages.pop(url))
+        if len(text) > self.max_bytes:
+            return
+        self.pages[url] = text
+        self.size += len(text)
+        while len(self.pages) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self.pages.popitem(last=False)
+            self.size -= len(evicted)
+
+
+# Async HTTP client with a bounded connection pool and per-host politeness
+#
+# connections_per_host caps the connections to any single host (0 for no cap), so several sites can share
+# the pool without one of them taking all of it. An optional CrawlMetrics (Crawl_Metrics.py) receives the
+# latency, status and size of every request and the time spent waiting for the politeness budget.
+class AsyncFetcher:
+    def __init__(self, max_connections=8, rate=0.5, burst=2, max_retries=4, backoff_base=2.0,
+                 timeout=60, headers=None, host_rates=None, cache=None, connections_per_host=0, metrics=None):
+        self.max_connections = max_connections
+        self.connections_per_host = connections_per_host
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.headers = headers or {'User-Agent': 'Mozilla/5.0'}
+        # Optional overrides per host: {'www.example.com': (rate, burst)}
+        self.host_rates = host_rates or {}
+        self.buckets = {}
+        self.session = None
+        # Successful pages are kept so every stage of a run can reuse them
+        self.cache = cache if cache is not None else PageCache()
+        self.in_flight = {}
+        self.metrics = metrics
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.connections_per_host)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    def bucket_for(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            rate, burst = self.host_rates.get(host, (self.rate, self.burst))
+            self.buckets[host] = TokenBucket(rate, burst)
+        return self.buckets[host]
+
+    def backoff_delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff_base ** attempt + random.uniform(0, 1)
+
+    # Returns (status, text); status is None when the request never got a response
+    async def fetch(self, url):
+        text = self.cache.get(url)
+        if text is not None:
+            return 200, text
+
+        # Concurrent requests for the same page share one download
+        if url in self.in_flight:
+            return await asyncio.shield(self.in_flight[url])
+        task = asyncio.ensure_future(self.download(url))
+        self.in_flight[url] = task
+        try:
+            status, text = await task
+        finally:
+            self.in_flight.pop(url, None)
+
+        if status == 200:
+            self.cache.put(url, text)
+        return status, text
+
+    async def download(self, url):
+        host = urlsplit(url).netloc
+        bucket = self.bucket_for(url)
+        status, text = None, ''
+        for attempt in range(self.max_retries + 1):
+            waited = await bucket.acquire()
+            retry_after = None
+            size = 0
+            start = time.perf_counter()
+            try:
+                async with self.session.get(url) as response:
+                    status = response.status
+                    retry_after = response.headers.get('Retry-After')
+                    # text() decodes the body read() already holds
+                    size = len(await response.read())
+                    text = await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("request failed url=%s error=%r", url, e)
+                status, text = None, ''
+            if self.metrics is not None:
+                self.metrics.observe_wait(host, waited)
+                self.metrics.observe_request(host, status, time.perf_counter() - start, size)
+            logger.debug("request url=%s status=%s bytes=%d waited=%.2f", url, status, size, waited)
+
+            if status is not None and status not in RETRY_STATUSES:
+                return status, text
+            if attempt < self.max_retries:
+                delay = self.backoff_delay(attempt, retry_after)
+                logger.warning("retrying url=%s status=%s delay=%.1f", url, status, delay)
+                bucket.pause(delay)
+        return status, text
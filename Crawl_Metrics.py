@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+
+# Counters and timings of one crawl run, written as a Prometheus text file or a JSON snapshot at the end
+#
+# Per host:   requests by status, request latency (sum, count, max), bytes downloaded and the time spent
+#             waiting for the politeness budget (token bucket and backoff)
+# Per stage:  seconds and calls of 'parse' (HTML to tree, one call per page), 'extract' (threads or posts
+#             out of a parsed page) and 'translate' (Translator calls, cache lookups included)
+# Totals:     translated texts and translation cache hits, page cache hits, posts and posts per second
+#
+# Translation runs in worker threads, so every update takes the lock.
+class CrawlMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.finished = None
+        self.hosts = {}
+        self.stages = {}
+        self.translated_texts = 0
+        self.translation_cache_hits = 0
+        self.page_cache_hits = 0
+        self.page_cache_misses = 0
+        self.posts = 0
+
+    def host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = {'statuses': Counter(), 'latency_sum': 0.0, 'latency_max': 0.0, 'bytes': 0,
+                                'wait_seconds': 0.0}
+        return self.hosts[host]
+
+    # status is None when the request got no response
+    def observe_request(self, host, status, seconds, size):
+        with self.lock:
+            stats = self.host(host)
+            stats['statuses'][str(status) if status is not None else 'error'] += 1
+            stats['latency_sum'] += seconds
+            stats['latency_max'] = max(stats['latency_max'], seconds)
+            stats['bytes'] += size
+
+    def observe_wait(self, host, seconds):
+        with self.lock:
+            self.host(host)['wait_seconds'] += seconds
+
+    def observe_stage(self, stage, seconds):
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    def observe_translation(self, seconds, texts, cache_hits):
+        self.observe_stage('translate', seconds)
+        with self.lock:
+            self.translated_texts += texts
+            self.translation_cache_hits += cache_hits
+
+    def observe_posts(self, count):
+        with self.lock:
+            self.posts += count
+
+    def finish(self, page_cache=None):
+        self.finished = time.time()
+        if page_cache is not None:
+            self.page_cache_hits = page_cache.hits
+            self.page_cache_misses = page_cache.misses
+
+    def snapshot(self):
+        duration = (self.finished or time.time()) - self.started
+        with self.lock:
+            hosts = {}
+            for host, stats in self.hosts.items():
+                requests = sum(stats['statuses'].values())
+                hosts[host] = {
+                    'requests': requests,
+                    'statuses': dict(stats['statuses']),
+                    'latency_seconds_sum': round(stats['latency_sum'], 6),
+                    'latency_seconds_avg': round(stats['latency_sum'] / requests, 6) if requests else 0.0,
+                    'latency_seconds_max': round(stats['latency_max'], 6),
+                    'bytes': stats['bytes'],
+                    'politeness_wait_seconds': round(stats['wait_seconds'], 6),
+                }
+            stages = {stage: {'seconds': round(seconds, 6), 'calls': calls,
+                              'seconds_per_call': round(seconds / calls, 6) if calls else 0.0}
+                      for stage, (seconds, calls) in self.stages.items()}
+            return {
+                'started': self.started,
+                'duration_seconds': round(duration, 6),
+                'hosts': hosts,
+                'stages': stages,
+                'translated_texts': self.translated_texts,
+                'translation_cache_hits': self.translation_cache_hits,
+                'page_cache_hits': self.page_cache_hits,
+                'page_cache_misses': self.page_cache_misses,
+                'posts': self.posts,
+                'posts_per_second': round(self.posts / duration, 3) if duration > 0 else 0.0,
+            }
+
+    # Prometheus text exposition format, e.g. for the node_exporter textfile collector
+    def to_prometheus(self, prefix='crawler'):
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f'{prefix}_{name}{{{label_text}}} {value}' if label_text else f'{prefix}_{name} {value}')
+
+        hosts = snapshot['hosts']
+        metric('requests_total', 'counter', 'HTTP requests by host and status',
+               [({'host': host, 'status': status}, count)
+                for host, stats in hosts.items() for status, count in stats['statuses'].items()])
+        metric('request_latency_seconds_sum', 'counter', 'Total request latency by host',
+               [({'host': host}, stats['latency_seconds_sum']) for host, stats in hosts.items()])
+        metric('request_latency_seconds_count', 'counter', 'Requests timed by host',
+               [({'host': host}, stats['requests']) for host, stats in hosts.items()])
+        metric('request_latency_seconds_max', 'gauge', 'Slowest request of the run by host',
+               [({'host': host}, stats['latency_seconds_max']) for host, stats in hosts.items()])
+        metric('downloaded_bytes_total', 'counter', 'Response bytes by host',
+               [({'host': host}, stats['bytes']) for host, stats in hosts.items()])
+        metric('politeness_wait_seconds_total', 'counter', 'Time spent waiting for the politeness budget by host',
+               [({'host': host}, stats['politeness_wait_seconds']) for host, stats in hosts.items()])
+        metric('stage_seconds_total', 'counter', 'Time spent per stage (parse, extract, translate)',
+               [({'stage': stage}, stats['seconds']) for stage, stats in snapshot['stages'].items()])
+        metric('stage_calls_total', 'counter', 'Calls per stage, parse calls are pages',
+               [({'stage': stage}, stats['calls']) for stage, stats in snapshot['stages'].items()])
+        metric('translated_texts_total', 'counter', 'Texts passed to the translator',
+               [({}, snapshot['translated_texts'])])
+        metric('translation_cache_hits_total', 'counter', 'Texts answered by the translation cache',
+               [({}, snapshot['translation_cache_hits'])])
+        metric('page_cache_hits_total', 'counter', 'Pages served from the in-memory page cache',
+               [({}, snapshot['page_cache_hits'])])
+        metric('page_cache_misses_total', 'counter', 'Pages not found in the in-memory page cache',
+               [({}, snapshot['page_cache_misses'])])
+        metric('posts_total', 'counter', 'Posts scraped in the run', [({}, snapshot['posts'])])
+        metric('posts_per_second', 'gauge', 'Posts scraped per second of the run', [({}, snapshot['posts_per_second'])])
+        metric('run_duration_seconds', 'gauge', 'Wall-clock time of the run', [({}, snapshot['duration_seconds'])])
+        metric('run_start_time_seconds', 'gauge', 'Unix time the run started', [({}, snapshot['started'])])
+        return '\n'.join(lines) + '\n'
+
+    # A .json file gets the snapshot, anything else the Prometheus text; replaced atomically for scrapers
+    def write(self, file_name):
+        if file_name.endswith('.json'):
+            content = json.dumps(self.snapshot(), indent=2)
+        else:
+            content = self.to_prometheus()
+        temp_file = file_name + '.tmp'
+        with open(temp_file, 'w') as f:
+            f.write(content)
+        os.replace(temp_file, file_name)
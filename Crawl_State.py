@@ -0,0 +1,68 @@
+import json
+import os
+
+
+# Per-thread crawl watermarks, stored as JSON next to the crawler output
+#
+# Every thread URL maps to:
+#   replies          reply count shown on the listing page at the last crawl
+#   last_page        last thread page that was fetched
+#   last_post        highest post number (the "#N" sequence) that was emitted
+#   model            model category decided from the thread title and first post
+#   first_post_date  date of the thread's first post
+#   last_activity    last activity time (Unix time) shown on the listing page
+#
+# Every crawled forum (by its forum URL) has a frontier: the work of a run that is not finished yet, i.e.
+# the listing pages still to read and the threads (by URL) that were queued but not flushed to the store,
+# plus the newest thread activity seen on its listing (older pages are not read again). Threads that failed
+# or stopped early wait in its retry list, with their number of attempts, since the listing is not read
+# far enough to find them again.
+#
+# The run section keeps what the scheduler needs between runs: the current polling interval.
+# Everything is saved in one file.
+class CrawlState:
+    def __init__(self, file_name='crawl_state.json'):
+        self.file_name = file_name
+        self.threads = {}
+        self.sites = {}
+        self.run = {}
+
+    def __contains__(self, thread_url):
+        return thread_url in self.threads
+
+    def __len__(self):
+        return len(self.threads)
+
+    def get(self, thread_url):
+        return self.threads.get(thread_url)
+
+    def update(self, thread_url, **fields):
+        self.threads.setdefault(thread_url, {}).update(fields)
+
+    def frontier(self, forum_url):
+        frontier = self.sites.setdefault(forum_url, {'listing': [], 'threads': {}, 'newest_activity': None})
+        # State files from before the retry list
+        frontier.setdefault('retry', {})
+        return frontier
+
+    def load(self, legacy_urls_file='crawled_urls.json'):
+        if os.path.exists(self.file_name):
+            with open(self.file_name, 'r') as f:
+                saved = json.load(f)
+            self.threads = saved['threads']
+            self.sites = saved.get('sites', {})
+            self.run = saved.get('run', {})
+        elif os.path.exists(legacy_urls_file):
+            # Threads from the old URL list are known but have no watermark yet
+            with open(legacy_urls_file, 'r') as f:
+                self.threads = {thread_url: {} for thread_url in json.load(f)}
+        return self
+
+    # Write to a temporary file first so a crash never leaves a half written state behind
+    def save(self):
+        temp_file = self.file_name + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump({'threads': self.threads, 'sites': self.sites, 'run': self.run}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.file_name)
@@ -0,0 +1,325 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+
+import numpy as np
+
+# Models of the NLP script and the branch or tag they are loaded from. The backends resolve it to the commit
+# it points to when they load a model, and the inference cache is keyed on that commit, so scores of a newer
+# model on the Hub are never mixed with cached ones. Put a commit hash here to stay on one model.
+ZERO_SHOT_MODEL = 'facebook/bart-large-mnli'
+ZERO_SHOT_REVISION = 'main'
+EMOTION_MODEL = 'j-hartmann/emotion-english-distilroberta-base'
+EMOTION_REVISION = 'main'
+
+# Same template the zero-shot pipeline uses to turn a label into an NLI hypothesis
+HYPOTHESIS_TEMPLATE = 'This example is {}.'
+# File next to an exported ONNX model with the commit it was exported from
+REVISION_FILE = 'revision.txt'
+
+
+# Function to resolve a branch or tag of a model on the Hub to its commit hash
+def commit_hash(model_name, revision):
+    from transformers import AutoConfig
+    return AutoConfig.from_pretrained(model_name, revision=revision)._commit_hash or revision
+
+
+# PyTorch eager inference through the transformers pipelines, the reference for the other backends
+#
+# zero_shot(texts, labels) returns one {'sequence', 'labels', 'scores'} per text, labels sorted by score.
+# emotions(texts) returns one list of {'label', 'score'} per text, sorted by score.
+# revisions holds the commit of each model ('zero_shot', 'emotion'), the revision of the inference cache keys.
+class TransformersBackend:
+    name = 'transformers'
+
+    def __init__(self):
+        from transformers import pipeline
+        self.revisions = {'zero_shot': commit_hash(ZERO_SHOT_MODEL, ZERO_SHOT_REVISION),
+                          'emotion': commit_hash(EMOTION_MODEL, EMOTION_REVISION)}
+        self.classifier = pipeline('zero-shot-classification', model=ZERO_SHOT_MODEL,
+                                   revision=self.revisions['zero_shot'])
+        self.emotion_pipeline = pipeline('text-classification', model=EMOTION_MODEL,
+                                         revision=self.revisions['emotion'], top_k=None)
+
+    def zero_shot(self, texts, labels):
+        results = self.classifier(texts, labels)
+        # A single text comes back as a dict instead of a list
+        return [results] if isinstance(results, dict) else results
+
+    def emotions(self, texts):
+        return self.emotion_pipeline(texts)
+
+
+# Splits token lengths into batches: texts of similar length go together so little padding is computed,
+# and a batch holds at most max_batch_tokens tokens (longest text times batch size) and max_batch_size texts
+def length_sorted_batches(lengths, max_batch_tokens=4096, max_batch_size=64):
+    order = sorted(range(len(lengths)), key=lambda index: lengths[index])
+    batches = []
+    batch = []
+    for index in order:
+        # Lengths only grow within the sorted order, so the current one is the longest of the batch
+        if batch and (len(batch) + 1 > max_batch_size or (len(batch) + 1) * lengths[index] > max_batch_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def softmax(logits, axis=-1):
+    exp = np.exp(logits - logits.max(axis=axis, keepdims=True))
+    return exp / exp.sum(axis=axis, keepdims=True)
+
+
+# One int8 ONNX sequence classification model with its tokenizer, as written by export_model
+class OnnxModel:
+    def __init__(self, model_dir, intra_op_threads=0, inter_op_threads=0, max_batch_tokens=4096, max_batch_size=64):
+        import onnxruntime
+        from transformers import AutoConfig, AutoTokenizer
+
+        options = onnxruntime.SessionOptions()
+        # 0 lets ONNX Runtime use one thread per physical core
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, 'model_quantized.onnx'), options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.config = AutoConfig.from_pretrained(model_dir)
+        self.revision = None
+        if os.path.exists(os.path.join(model_dir, REVISION_FILE)):
+            with open(os.path.join(model_dir, REVISION_FILE), 'r') as f:
+                self.revision = f.read().strip()
+        else:
+            logging.warning(f"{model_dir} has no {REVISION_FILE}, export the models again to key the cache on their commit")
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+
+    # Logits of every text (or text pair) in input order, computed in length-sorted batches
+    def logits(self, texts, pairs=None, truncation=True):
+        if pairs is None:
+            encodings = self.tokenizer(texts, truncation=truncation)
+        else:
+            encodings = self.tokenizer(texts, pairs, truncation=truncation)
+        input_ids = encodings['input_ids']
+        lengths = [len(ids) for ids in input_ids]
+
+        logits = np.zeros((len(texts), self.config.num_labels), dtype=np.float32)
+        for batch in length_sorted_batches(lengths, self.max_batch_tokens, self.max_batch_size):
+            features = [{key: encodings[key][index] for key in encodings.keys()} for index in batch]
+            padded = self.tokenizer.pad(features, return_tensors='np')
+            inputs = {name: padded[name].astype(np.int64) for name in padded.keys() if name in self.input_names}
+            logits[batch] = self.session.run(['logits'], inputs)[0]
+        return logits
+
+
+# Quantized ONNX Runtime inference with the same outputs as TransformersBackend
+#
+# Both models are exported once with export_models (python Inference_Backends.py export). Every call
+# tokenizes all texts, sorts them by length and pads each batch only to its own longest text, instead of
+# padding a fixed number of posts to the longest one.
+class OnnxBackend:
+    name = 'onnx'
+
+    def __init__(self, model_dir='onnx_models', intra_op_threads=0, inter_op_threads=0, max_batch_tokens=4096,
+                 max_batch_size=64):
+        settings = dict(intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads,
+                        max_batch_tokens=max_batch_tokens, max_batch_size=max_batch_size)
+        self.zero_shot_model = OnnxModel(os.path.join(model_dir, 'zero-shot'), **settings)
+        self.emotion_model = OnnxModel(os.path.join(model_dir, 'emotion'), **settings)
+        # Exports from before the revision file only know the branch they came from
+        self.revisions = {'zero_shot': self.zero_shot_model.revision or ZERO_SHOT_REVISION,
+                          'emotion': self.emotion_model.revision or EMOTION_REVISION}
+
+        label2id = {label.lower(): index for label, index in self.zero_shot_model.config.label2id.items()}
+        self.entailment_id = next((index for label, index in label2id.items() if label.startswith('entail')), -1)
+
+    # One NLI pass per (text, label) pair; the entailment logits are normalised over the labels of a text
+    def zero_shot(self, texts, labels):
+        hypotheses = [HYPOTHESIS_TEMPLATE.format(label) for label in labels]
+        premises = [text for text in texts for _ in labels]
+        pairs = [hypothesis for _ in texts for hypothesis in hypotheses]
+        logits = self.zero_shot_model.logits(premises, pairs, truncation='only_first')
+        entailment = logits[:, self.entailment_id].reshape(len(texts), len(labels))
+        scores = softmax(entailment)
+
+        results = []
+        for text, text_scores in zip(texts, scores):
+            order = np.argsort(-text_scores, kind='stable')
+            results.append({
+                'sequence': text,
+                'labels': [labels[index] for index in order],
+                'scores': [float(text_scores[index]) for index in order],
+            })
+        return results
+
+    def emotions(self, texts):
+        scores = softmax(self.emotion_model.logits(texts))
+        id2label = self.emotion_model.config.id2label
+        results = []
+        for text_scores in scores:
+            order = np.argsort(-text_scores, kind='stable')
+            results.append([{'label': id2label[int(index)], 'score': float(text_scores[index])} for index in order])
+        return results
+
+
+# Persistent cache of raw model scores, keyed by (model id, revision commit, label set, normalized text)
+#
+# Values are stored as JSON exactly as the model returned them (scores, not decisions), so thresholds and
+# rules can be re-applied to the whole history without running the models again. Nothing is evicted.
+class InferenceCache:
+    def __init__(self, file_name='inference_cache.sqlite'):
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        # Worker processes of NLP.py share the file, give a busy writer time to finish
+        self.conn = sqlite3.connect(file_name, timeout=30, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, scores TEXT NOT NULL)')
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    # Unicode composition, runs of whitespace and surrounding blanks do not change the key
+    @staticmethod
+    def normalize(text):
+        return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+    @staticmethod
+    def key(model, revision, labels, text):
+        identity = json.dumps([model, revision, list(labels)], ensure_ascii=False)
+        normalized = InferenceCache.normalize(text)
+        return hashlib.sha256(f'{identity}\0{normalized}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(f'SELECT key, scores FROM scores WHERE key IN ({placeholders})', chunk).fetchall()
+                found.update((key, json.loads(scores)) for key, scores in rows)
+        return found
+
+    def put_many(self, items):
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO scores (key, scores) VALUES (?, ?)',
+                                  [(key, json.dumps(scores)) for key, scores in items.items()])
+            self.conn.commit()
+
+    # Scores of every text in order; compute(texts) only gets the texts that are not cached, each one once
+    def scores(self, texts, compute, model, revision, labels=()):
+        keys = [self.key(model, revision, labels, text) for text in texts]
+        found = self.get_many(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            computed = dict(zip(missing, compute(list(missing.values()))))
+            self.put_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# Function to export a model to ONNX and quantize its weights to int8 (dynamic quantization), needs optimum
+# The model and its tokenizer come from the same commit, which is written to REVISION_FILE
+def export_model(model_name, revision, output_dir):
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    revision = commit_hash(model_name, revision)
+    model = ORTModelForSequenceClassification.from_pretrained(model_name, revision=revision, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_name, revision=revision).save_pretrained(output_dir)
+
+    quantizer = ORTQuantizer.from_pretrained(output_dir)
+    # Dynamic quantization needs no calibration data; avx2 kernels run on every x86-64 box we use
+    quantization_config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=output_dir, quantization_config=quantization_config)
+    with open(os.path.join(output_dir, REVISION_FILE), 'w') as f:
+        f.write(revision)
+    logging.info(f"Exported {model_name} at {revision} to {output_dir}")
+
+
+def export_models(model_dir='onnx_models'):
+    export_model(ZERO_SHOT_MODEL, ZERO_SHOT_REVISION, os.path.join(model_dir, 'zero-shot'))
+    export_model(EMOTION_MODEL, EMOTION_REVISION, os.path.join(model_dir, 'emotion'))
+
+
+# Function to compare the labels of two backends on the same texts
+#
+# A text agrees when both backends pick the same top zero-shot label, the same labels above the
+# threshold the NLP script uses, and the same top emotion. Score differences are reported as well.
+def parity_check(texts, reference, candidate, labels, threshold=0.3, min_agreement=0.95):
+    reference_zero_shot = reference.zero_shot(texts, labels)
+    candidate_zero_shot = candidate.zero_shot(texts, labels)
+    reference_emotions = reference.emotions(texts)
+    candidate_emotions = candidate.emotions(texts)
+
+    agreeing = 0
+    score_differences = []
+    disagreements = []
+    for text, ref_zero, cand_zero, ref_emotion, cand_emotion in zip(texts, reference_zero_shot, candidate_zero_shot,
+                                                                   reference_emotions, candidate_emotions):
+        ref_scores = dict(zip(ref_zero['labels'], ref_zero['scores']))
+        cand_scores = dict(zip(cand_zero['labels'], cand_zero['scores']))
+        score_differences.extend(abs(ref_scores[label] - cand_scores[label]) for label in labels)
+        ref_emotion_scores = {e['label']: e['score'] for e in ref_emotion}
+        cand_emotion_scores = {e['label']: e['score'] for e in cand_emotion}
+        score_differences.extend(abs(score - cand_emotion_scores[label]) for label, score in ref_emotion_scores.items())
+
+        same_labels = (ref_zero['labels'][0] == cand_zero['labels'][0]
+                       and {label for label, score in ref_scores.items() if score > threshold}
+                       == {label for label, score in cand_scores.items() if score > threshold}
+                       and ref_emotion[0]['label'] == cand_emotion[0]['label'])
+        if same_labels:
+            agreeing += 1
+        else:
+            disagreements.append(text)
+
+    report = {
+        'texts': len(texts),
+        'agreement': agreeing / len(texts) if texts else 1.0,
+        'max_score_difference': max(score_differences, default=0.0),
+        'mean_score_difference': float(np.mean(score_differences)) if score_differences else 0.0,
+        'disagreements': disagreements,
+    }
+    report['passed'] = report['agreement'] >= min_agreement
+    return report
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # python Inference_Backends.py export [model dir]
+    # python Inference_Backends.py parity <Web Crawled.xlsx> [sample size] [model dir]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'export'
+    if command == 'export':
+        export_models(sys.argv[2] if len(sys.argv) > 2 else 'onnx_models')
+    elif command == 'parity':
+        import pandas as pd
+        sample_size = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+        data = pd.read_excel(sys.argv[2])
+        texts = [str(text) for text in data['post_content'].dropna().head(sample_size)]
+        # Same labels as candidate_labels in NLP.py
+        labels = ["connectivity", "installation", "other technical issue", "feature request"]
+        report = parity_check(texts, TransformersBackend(),
+                              OnnxBackend(sys.argv[4] if len(sys.argv) > 4 else 'onnx_models'), labels)
+        print(json.dumps({key: value for key, value in report.items() if key != 'disagreements'}, indent=2))
+        sys.exit(0 if report['passed'] else 1)
+    else:
+        sys.exit(f"Unknown command {command}, use export or parity")
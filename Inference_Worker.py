@@ -0,0 +1,211 @@
+import logging
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+# Local TCP works everywhere; a path such as /tmp/nlp_inference.sock uses a Unix socket instead
+DEFAULT_ADDRESS = ('127.0.0.1', 8642)
+# Without INFERENCE_WORKER_KEY the worker writes a random key to this file (readable only by its owner)
+# and the clients on the same machine read it from there
+DEFAULT_KEY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inference_worker.key')
+
+
+# Function to get the key that authenticates the connections; create makes a new one if there is none yet
+def load_authkey(key_file=DEFAULT_KEY_FILE, create=False):
+    key = os.environ.get('INFERENCE_WORKER_KEY')
+    if key:
+        return key.encode('utf-8')
+    if create and not os.path.exists(key_file):
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        logging.info(f"Wrote a new inference worker key to {key_file}")
+    try:
+        with open(key_file) as f:
+            return f.read().strip().encode('utf-8')
+    except FileNotFoundError:
+        raise RuntimeError("No inference worker key: start Inference_Worker.py on this machine first, "
+                           "or set INFERENCE_WORKER_KEY for the worker and the clients") from None
+
+
+# "host:port" or a socket path, as given on the command line or in the NLP.py settings
+def parse_address(address):
+    if isinstance(address, (tuple, list)):
+        return tuple(address)
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit() and not address.startswith('/'):
+        return host, int(port)
+    return address
+
+
+# Long-lived process that keeps one copy of the models in memory and serves classification requests
+#
+# Every connection gets a thread that forwards its requests to one inference thread. That thread waits up
+# to max_wait seconds for more requests and runs the ones with the same method and labels as one backend
+# call of at most max_batch_texts texts, so several small consumers share the batches.
+#
+# Requests are tuples: ('info',), ('zero_shot', texts, labels) or ('emotions', texts).
+# Replies are ('ok', result) or ('error', message).
+class InferenceWorker:
+    def __init__(self, backend, address=DEFAULT_ADDRESS, authkey=None, max_batch_texts=256, max_wait=0.01):
+        self.backend = backend
+        self.address = parse_address(address)
+        self.authkey = authkey or load_authkey(create=True)
+        self.max_batch_texts = max_batch_texts
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+
+    def serve_forever(self):
+        threading.Thread(target=self.run_batches, daemon=True).start()
+        with Listener(self.address, authkey=self.authkey) as listener:
+            logging.info(f"Inference worker ({self.backend.name}) listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # A client with the wrong key, or one that went away during the handshake
+                    logging.error(f"Rejected inference worker connection: {e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                except Exception as e:
+                    # The message arrived but could not be unpickled
+                    conn.send(('error', f"Unreadable request: {e!r}"))
+                    continue
+                # Bad requests are answered here, they never reach the inference thread
+                error = request_error(request)
+                if error:
+                    logging.warning(f"Rejected inference worker request: {error}")
+                    conn.send(('error', error))
+                    continue
+                if request[0] == 'info':
+                    conn.send(('ok', {'backend': self.backend.name, 'revisions': self.backend.revisions}))
+                    continue
+                reply = queue.Queue(maxsize=1)
+                self.requests.put((request, reply))
+                conn.send(reply.get())
+
+    def run_batches(self):
+        while True:
+            pending = [self.requests.get()]
+            texts = len(pending[0][0][1])
+            deadline = time.monotonic() + self.max_wait
+            while texts < self.max_batch_texts:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                texts += len(pending[-1][0][1])
+
+            groups = {}
+            for request, reply in pending:
+                key = (request[0], tuple(request[2]) if len(request) > 2 else ())
+                groups.setdefault(key, []).append((request, reply))
+            for (method, labels), group in groups.items():
+                self.run_group(method, labels, group)
+
+    def run_group(self, method, labels, group):
+        texts = [text for request, _ in group for text in request[1]]
+        try:
+            if method == 'zero_shot':
+                results = self.backend.zero_shot(texts, list(labels))
+            elif method == 'emotions':
+                results = self.backend.emotions(texts)
+            else:
+                raise ValueError(f"Unknown method {method}")
+        except Exception as e:
+            logging.error(f"Error during {method}: {e}")
+            for _, reply in group:
+                reply.put(('error', repr(e)))
+            return
+
+        start = 0
+        for request, reply in group:
+            reply.put(('ok', results[start:start + len(request[1])]))
+            start += len(request[1])
+
+
+# Function to check a request before it is queued, returns the problem or None
+def request_error(request):
+    if not isinstance(request, tuple) or not request:
+        return f"Request is not a non-empty tuple: {type(request).__name__}"
+    arguments = {'info': 0, 'zero_shot': 2, 'emotions': 1}.get(request[0])
+    if arguments is None:
+        return f"Unknown method {request[0]!r}"
+    if len(request) != arguments + 1:
+        return f"{request[0]} takes {arguments} arguments, got {len(request) - 1}"
+    for name, value in zip(['texts', 'labels'], request[1:]):
+        if not isinstance(value, (list, tuple)) or not all(isinstance(text, str) for text in value):
+            return f"{request[0]} needs {name} as a list of strings"
+    return None
+
+
+# Backend that sends the requests to a running InferenceWorker, with the same interface as the local ones
+#
+# A lost connection (worker restarted, network error) is opened again with exponential backoff, up to
+# retries times per call. After that the call raises ConnectionError.
+class RemoteBackend:
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, retries=5, backoff=0.5):
+        self.address = parse_address(address)
+        self.authkey = authkey or load_authkey()
+        self.retries = retries
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.conn = Client(self.address, authkey=self.authkey)
+        info = self.call('info')
+        self.name = info['backend']
+        # The commits of the worker's models, the scripts key their inference cache on them
+        self.revisions = info['revisions']
+
+    def call(self, *request):
+        with self.lock:
+            for attempt in range(self.retries + 1):
+                try:
+                    if self.conn is None:
+                        self.conn = Client(self.address, authkey=self.authkey)
+                    self.conn.send(request)
+                    status, result = self.conn.recv()
+                    break
+                except (EOFError, OSError) as e:
+                    self.close()
+                    if attempt == self.retries:
+                        raise ConnectionError(f"Inference worker at {self.address} unreachable: {e!r}") from e
+                    delay = self.backoff * 2 ** attempt
+                    logging.warning(f"Inference worker connection lost ({e!r}), reconnecting in {delay:.1f} s")
+                    time.sleep(delay)
+        if status == 'error':
+            raise RuntimeError(f"Inference worker failed: {result}")
+        return result
+
+    def zero_shot(self, texts, labels):
+        return self.call('zero_shot', list(texts), list(labels))
+
+    def emotions(self, texts):
+        return self.call('emotions', list(texts))
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+if __name__ == '__main__':
+    # python Inference_Worker.py [host:port | socket path]
+    # Loads the backend configured in NLP.py (inference_backend, onnx_model_dir, threads) once and keeps it warm
+    import NLP
+    address = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ADDRESS
+    InferenceWorker(NLP.load_local_backend(), address).serve_forever()
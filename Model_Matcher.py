@@ -0,0 +1,110 @@
+import json
+import os
+import re
+from collections import Counter
+
+CATALOGUE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_catalogue.json')
+
+
+def load_catalogue(file_name=CATALOGUE_FILE):
+    with open(file_name, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# True when the alias is an alternation at its outermost level, like r'\bimow|\bevo'
+def is_alternation(alias):
+    depth = 0
+    in_class = False
+    escaped = False
+    for char in alias:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+    return False
+
+
+# Leading word of an alias like r'\bimow\s*5\b', None when the alias does not start with a fixed one
+def alias_anchor(alias):
+    if is_alternation(alias):
+        return None
+    # A letter followed by a quantifier is optional and not part of the anchor
+    match = re.match(r'\\b([a-z0-9]+)(?![?*{])', alias, re.IGNORECASE)
+    return match.group(1).lower() if match else None
+
+
+# Finds every model mention of the catalogue in one scan over the text
+#
+# All aliases are compiled into a single pattern of named alternatives inside a lookahead, so mentions may
+# overlap like they did with one re.search per pattern. Groups (e.g. "iMOW 5-7") come first, so a range is
+# not cut short by the single model it starts with. When every alias starts with a word ("imow", "evo",
+# ...), the pattern is only tried where str.find locates one of those words instead of at every position.
+class ModelMatcher:
+    def __init__(self, catalogue=None):
+        catalogue = catalogue if catalogue is not None else load_catalogue()
+        self.models = [model['name'] for model in catalogue['models']]
+        self.group_names = [group['name'] for group in catalogue.get('groups', [])]
+        self.targets = {}
+        alternatives = []
+        entries = [(group['name'], group['aliases'], tuple(group['models'])) for group in catalogue.get('groups', [])]
+        entries += [(model['name'], model['aliases'], (model['name'],)) for model in catalogue['models']]
+        for name, aliases, models in entries:
+            for alias in aliases:
+                group = f'm{len(alternatives)}'
+                self.targets[group] = (name, models)
+                alternatives.append(f'(?P<{group}>{alias})')
+        self.pattern = re.compile('(?=' + '|'.join(alternatives) + ')', re.IGNORECASE)
+
+        anchors = {alias_anchor(alias) for _, aliases, _ in entries for alias in aliases}
+        if None in anchors:
+            self.anchors = None
+        else:
+            # "imow7evo" is found through "imow" already
+            self.anchors = sorted(anchor for anchor in anchors
+                                  if not any(anchor != other and anchor.startswith(other) for other in anchors))
+
+    def matches(self, text):
+        lowered = text.lower()
+        if self.anchors is None or len(lowered) != len(text):
+            yield from self.pattern.finditer(text)
+            return
+        positions = set()
+        for anchor in self.anchors:
+            position = lowered.find(anchor)
+            while position != -1:
+                positions.add(position)
+                position = lowered.find(anchor, position + 1)
+        for position in sorted(positions):
+            match = self.pattern.match(text, position)
+            if match:
+                yield match
+
+    # Mentions as (name, start, end); a group mention is reported under the group name
+    def find(self, text):
+        mentions = []
+        for match in self.matches(text):
+            name, _ = self.targets[match.lastgroup]
+            start, end = match.span(match.lastgroup)
+            mentions.append((name, start, end))
+        return mentions
+
+    # Number of mentions per model, group mentions count for every model of the group
+    def counts(self, text):
+        counts = Counter()
+        for match in self.matches(text):
+            _, models = self.targets[match.lastgroup]
+            counts.update(models)
+        return counts
+
+    def extract(self, text):
+        return set(self.counts(text))
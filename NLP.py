@@ -1,66 +1,135 @@
 import pandas as pd
 import re
+from importlib.metadata import version
 from textblob import TextBlob
-from transformers import pipeline
+from Inference_Backends import EMOTION_MODEL, ZERO_SHOT_MODEL, InferenceCache, OnnxBackend, TransformersBackend
+from Inference_Worker import RemoteBackend
+from Rule_Engine import RuleEngine, load_rules
+from Cascade_Classifier import Cascade, FastClassifier, train_fast_classifier
+from Text_Dedup import DedupIndex
+from NLP_Metrics import NLPMetrics
+from Post_Store import PostStore
+from Analysis_Store import ANALYSIS_COLUMNS, AnalysisStore, rollup_file_name, rollup_frame, write_excel
+from openpyxl import load_workbook
 import os
+import sys
 import time
+import math
+import json
+import itertools
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Load pre-trained models once
-classifier = pipeline('zero-shot-classification', model='facebook/bart-large-mnli', revision='main')
-emotion_pipeline = pipeline('text-classification', model='j-hartmann/emotion-english-distilroberta-base', top_k=None)
+# Inference settings
+inference_backend = 'transformers'  # 'onnx' runs int8 ONNX models, export them once with: python Inference_Backends.py export
+onnx_model_dir = 'onnx_models'
+intra_op_threads = 0  # ONNX Runtime threads within an operator, 0 uses every physical core
+inter_op_threads = 0  # ONNX Runtime threads running independent operators
+max_batch_tokens = 4096  # Padded tokens per ONNX batch, posts are sorted by length before batching
+batch_size = 64  # Posts handed to the models at a time
+inference_cache_file = 'inference_cache.sqlite'  # Raw model scores of every post text seen, None to turn it off
+inference_worker = None  # Address of a running Inference_Worker.py, e.g. '127.0.0.1:8642'; None loads the models here
+dedup_index_file = 'dedup_index.sqlite'  # Posts that only differ in case and punctuation run through the models once, shared with the crawler; None turns it off
+dedup_threshold = 0.9  # Estimated share of common word 3-grams that makes two posts near-duplicates
+
+# Parallel settings
+nlp_workers = 1  # Processes sharing the new posts, each loads its own models; 1 runs everything in this process
+threads_per_worker = None  # torch/BLAS/ONNX threads of each process, None divides the cores between the processes
+# Settings a worker process takes over from this one
+WORKER_SETTINGS = ['inference_backend', 'onnx_model_dir', 'max_batch_tokens', 'batch_size', 'inference_cache_file',
+                   'inference_worker', 'dedup_index_file', 'dedup_threshold', 'cascade_model_file', 'cascade_confidence',
+                   'cascade_max_chars', 'cascade_audit_rate', 'progress_interval', 'profile_file', 'stage_hooks']
+# Thread limits of torch and the BLAS libraries, given to the worker processes
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+
+# Cascade settings: a fast classifier trained on the cached zero-shot scores answers the posts it is sure about
+cascade_model_file = None  # e.g. 'cascade_model.pkl', train it with: python NLP.py --train-cascade
+cascade_confidence = 0.9  # Probability every label needs on one side to skip the zero-shot model, at least 0.7
+cascade_max_chars = 1000  # Longer posts always go to the zero-shot model
+cascade_audit_rate = 0.05  # Share of fast answers also checked by the zero-shot model, for the agreement rate
+
+# Profiling settings: every run logs a table of the time spent per stage (see NLP_Metrics.py)
+progress_interval = 30  # Seconds between progress lines while posts are categorized
+profile_file = None  # e.g. 'nlp_profile.prof', cProfile stats of the last run for snakeviz or pstats
+stage_hooks = []  # Module-level functions called with (stage, seconds, items) after every stage of a batch
+
+# Consumer settings: new posts are read from the crawler's store as it writes them
+post_store_file = 'crawl_store.sqlite'  # Store Web_Crawling.py appends to
+analysis_store_file = 'nlp_store.sqlite'  # Results and the committed offset, so a restart never reads old posts again
+consumer_batch_size = 256  # Most new posts classified and committed at a time
+consumer_poll_interval = 2  # Seconds between checks while there are no new posts
+consumer_max_failures = 10  # Failed batches in a row before the consumer stops, None retries for ever
+export_interval = None  # Seconds between exports of output_file while consuming, None exports only on demand
+
+# Backfill settings
+backfill_dir = 'NLP Backfill'  # One workbook per chunk, e.g. for a Power BI folder source
+backfill_chunk_size = 5000  # Posts read, classified and written at a time
+
+# Input and output files
+excel_file = "C:\\Users\\Vishwas Goswami\\OneDrive\\Documents\\Final Thesis\\Web Crawled.xlsx"  # Read by --excel
+output_file = 'NLP Analysis.xlsx'
+
+# Models are loaded on first use, so importing this script (e.g. for detect_keywords) stays fast
+_backend = None
+_inference_cache = None
+_cascade = None
+_dedup_index = None
+
+def load_local_backend():
+    if inference_backend == 'onnx':
+        return OnnxBackend(onnx_model_dir, intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads,
+                           max_batch_tokens=max_batch_tokens)
+    return TransformersBackend()
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if inference_worker:
+            _backend = RemoteBackend(inference_worker)
+            # Cached scores are keyed by inference_backend, the worker has to run the same one
+            if _backend.name != inference_backend:
+                logging.warning(f"Inference worker runs {_backend.name}, but inference_backend is {inference_backend}")
+        else:
+            _backend = load_local_backend()
+    return _backend
+
+# Function to forget the inference worker after it could not be reached, so the next batch connects again
+def drop_remote_backend(error):
+    global _backend
+    if isinstance(error, ConnectionError) and isinstance(_backend, RemoteBackend):
+        _backend.close()
+        _backend = None
+
+def get_inference_cache():
+    global _inference_cache
+    if _inference_cache is None and inference_cache_file:
+        _inference_cache = InferenceCache(inference_cache_file)
+    return _inference_cache
 
 # Define categories for zero-shot classification
 candidate_labels = ["connectivity", "installation", "other technical issue", "feature request"]
+zero_shot_threshold = 0.3  # Labels scoring above it are assigned
+
+# Keyword and heuristic rules (technical keywords, countries, iMOW models, questions, emotions, ...)
+# Edit nlp_rules.json to change them
+rules = load_rules()
+rule_engine = RuleEngine(rules)
 
-# Keywords for specific technical categories
-technical_keywords = {
-    "blades": r"\b(?:blade|blades|knive|knives)\b",
-    "hardware": r"\b(?:dock|docking station|spare parts|wheel|wheels|tire|tyre|rotation|motor)\b",
-    "connectivity": r"\b(?:server|mobile network|WLAN|GPS|Bluetooth|connectivity)\b",
-    "software": r"\b(?:software version|standard settings|driving functions|functions)\b",
-    "installation": r"\b(?:mowing time|install|installation|guide wire|boundary wire)\b",
-    "design": r"\b(?:deck|design)\b",
-    "app": r"\b(?:app|application|mobile app|software app|iMOW app)\b"
-}
-
-# Countries
-countries = ["Germany", "UK", "Russia", "China", "India", "Italy", "Brazil", "USA", "Czech Republic", "Austria"]
-
-# iMOW Models
-imow_models = {
-    'iMOW 7 EVO': r'\bstihl\s*imow\s*7\s*evo\b|\bstihl\s*imow7evo\b|\bstihl\s*mower\s*7\s*evo\b|\bevo\s*7\b',
-    'iMOW 7': r'\bstihl\s*imow\s*7\b|\bstihl\s*imow7\b|\bstihl\s*mower\s*7\b|\biMOW\s*7\b',
-    'iMOW 6 EVO': r'\bstihl\s*imow\s*6\s*evo\b|\bstihl\s*imow6evo\b|\bstihl\s*mower\s*6\s*evo\b|\bevo\s*6\b',
-    'iMOW 6': r'\bstihl\s*imow\s*6\b|\bstihl\s*imow6\b|\bstihl\s*mower\s*6\b|\biMOW\s*6\b',
-    'iMOW 5 EVO': r'\bstihl\s*imow\s*5\s*evo\b|\bstihl\s*imow5evo\b|\bstihl\s*mower\s*5\s*evo\b|\bevo\s*5\b',
-    'iMOW 5': r'\bstihl\s*imow\s*5\b|\bstihl\s*imow5\b|\bstihl\s*mower\s*5\b|\biMOW\s*5\b',
-    'iMOW 4': r'\bstihl\s*imow\s*4\b|\bstihl\s*imow4\b|\bstihl\s*mower\s*4\b|\biMOW\s*4\b',
-    'iMOW 522': r'\bstihl\s*imow\s*522\b|\bstihl\s*mower\s*522\b|\biMOW\s*522\b|\biMOW\s*522C\b|\biMOW\s*522PC\b',
-    'iMOW 422': r'\bstihl\s*imow\s*422\b|\bstihl\s*mower\s*422\b|\biMOW\s*422\b|\biMOW\s*422C\b|\biMOW\s*422PC\b',
-    'iMOW 632': r'\bstihl\s*imow\s*632\b|\bstihl\s*mower\s*632\b|\biMOW\s*632\b|\biMOW\s*632C\b|\biMOW\s*632PC\b',
-    'STIHL automower': r'\bstihl\s*automower\b',
-    'STIHL robot': r'\bstihl\s*robot\b',
-    'STIHL mower': r'\bstihl\s*mower\b',
-    'STIHL robot mower': r'\bstihl\s*robot\s*mower\b',
-    'STIHL iMOW': r'\bstihl\s*imow\b',
-    'STIHL mower robot': r'\bstihl\s*mower\s*robot\b',
-    'STIHL robotic mower': r'\bstihl\s*robotic\s*mower\b'
-}
-
-# Emotion keywords
-emotion_keywords = {
-    "anticipation": ["curiosity", "excited", "positive attitude", "hopeful", "possibility", "urgency", "forward thinking"],
-    "frustration": ["frustration", "errors", "system", "angry", "disgusted", "disappointment"],
-    "inquiry": ["solution", "request", "information", "question", "wondering", "gratitude"],
-    "preference": ["desired outcome", "suggestions", "feature request", "improvement", "replacement", "old models", "old software", "old technology"],
-    "suggestive": ["sharing information", "sharing tools", "sharing experience", "suggestions", "helpful"],
-    "satisfied": ["happy", "joy", "joyful", "excited"]
-}
+# Function to get the rules of one family of nlp_rules.json
+def rule_family(name):
+    return next(family['rules'] for family in rules['families'] if family['name'] == name)
+
+# The rule tables by their old names
+technical_keywords = {rule['name']: rule['pattern'] for rule in rule_family('technical_keywords')}
+countries = [rule['name'] for rule in rule_family('countries')]
+imow_models = {rule['name']: rule['pattern'] for rule in rule_family('imow_models')}
+emotion_keywords = {rule['name']: rule['words'] for rule in rule_family('emotions')}
 
 # Function to detect keywords in a text and return matches
 def detect_keywords_with_matches(text, patterns):
@@ -81,38 +150,154 @@ def detect_keywords(text, patterns):
             detected.append(key)
     return detected
 
-# Function to categorize comments
-def categorize_comments(data):
+# Function to run a model only on the texts the inference cache does not know yet
+def cached_scores(texts, compute, model, revision, labels=()):
+    inference_cache = get_inference_cache()
+    if inference_cache is None:
+        unique_texts = list(dict.fromkeys(texts))
+        scores = dict(zip(unique_texts, compute(unique_texts)))
+        return [scores[text] for text in texts]
+    return inference_cache.scores(texts, compute, model, revision, labels)
+
+# Functions returning the raw scores that are cached: polarity, zero-shot labels and scores, emotion scores
+def sentiment_polarities(texts):
+    return [TextBlob(content).sentiment.polarity for content in texts]
+
+def zero_shot_scores(texts):
+    return [{'labels': result['labels'], 'scores': result['scores']} for result in get_backend().zero_shot(texts, candidate_labels)]
+
+def emotion_model_scores(texts):
+    return get_backend().emotions(texts)
+
+def zero_shot_model_id():
+    return f'{inference_backend}:{ZERO_SHOT_MODEL}'
+
+# Function to get the commit of a model ('zero_shot' or 'emotion') the backend loaded, the revision of its cache keys
+def model_revision(model):
+    return get_backend().revisions[model]
+
+# Function to run the zero-shot model, through the inference cache
+def zero_shot_model_results(texts):
+    return cached_scores(texts, zero_shot_scores, zero_shot_model_id(), model_revision('zero_shot'), candidate_labels)
+
+def get_dedup_index():
+    global _dedup_index
+    if _dedup_index is None and dedup_index_file:
+        _dedup_index = DedupIndex(dedup_index_file, threshold=dedup_threshold)
+    return _dedup_index
+
+def get_cascade():
+    global _cascade
+    if _cascade is None and cascade_model_file:
+        fast = FastClassifier.load(cascade_model_file)
+        if fast.labels != candidate_labels or fast.threshold != zero_shot_threshold:
+            logging.warning(f"{cascade_model_file} was trained for other labels or another threshold, train it again")
+            # Remembered, so the file is not loaded and warned about again for every batch
+            _cascade = False
+        else:
+            _cascade = Cascade(fast, zero_shot_model_results, cascade_confidence, cascade_max_chars,
+                               cascade_audit_rate)
+    return _cascade or None
+
+# Function to classify posts with the zero-shot labels, through the cascade when cascade_model_file is set
+def zero_shot_results(texts):
+    cascade = get_cascade()
+    if cascade is None:
+        return zero_shot_model_results(texts)
+    # Posts the zero-shot model scored before keep those scores, only new ones go through the cascade
+    inference_cache = get_inference_cache()
+    revision = model_revision('zero_shot')
+    keys = [InferenceCache.key(zero_shot_model_id(), revision, candidate_labels, text) for text in texts]
+    found = inference_cache.get_many(list(set(keys))) if inference_cache is not None else {}
+    new_texts = list(dict.fromkeys(text for key, text in zip(keys, texts) if key not in found))
+    new_results = dict(zip(new_texts, cascade.zero_shot(new_texts)))
+    return [found[key] if key in found else new_results[text] for key, text in zip(keys, texts)]
+
+def new_metrics():
+    return NLPMetrics(progress_interval, profile_file, stage_hooks)
+
+# Function to categorize comments, the time of every stage goes to metrics
+# Without metrics the call gets its own and logs their summary table at the end
+# With strict a failed model stage raises instead of leaving the model labels of its batch empty
+def categorize_comments(data, metrics=None, strict=False):
+    summarize = metrics is None
+    metrics = metrics or new_metrics()
+    with metrics.profile():
+        categorized_data = categorize_batches(data, metrics, strict)
+    if summarize:
+        metrics.log_summary()
+    return categorized_data
+
+def categorize_batches(data, metrics, strict=False):
     categorized_data = []
-    batch_size = 8  # Adjust batch size based on your system's capabilities
 
     total_items = len(data)
     processed_items = 0
 
+    # TextBlob is pure Python, so it runs next to the models, which release the GIL while they compute
+    stage_executor = ThreadPoolExecutor(max_workers=1)
+
+    # The keyword and heuristic rules run over all posts at once
+    with metrics.stage('rules', total_items):
+        rule_results = rule_engine.evaluate(item['post_content'].lower() if pd.notna(item['post_content']) else ""
+                                            for item in data)
+
     for i in range(0, total_items, batch_size):
         batch = data[i:i+batch_size]
+        batch_start = time.perf_counter()
 
         post_contents = [str(item['post_content']) if pd.notna(item['post_content']) else "" for item in batch]
+        metrics.observe_lengths(post_contents)
+
+        # Posts with the same normalized text run through the models once, as the first of them (see
+        # DedupIndex.fan_out); near-duplicates run on their own text, a few words can change what a post says
+        dedup_index = get_dedup_index()
+        if dedup_index is not None:
+            with metrics.stage('dedup', len(batch)):
+                clusters = dedup_index.assign(post_contents)
+            first_texts = {}
+            for (key, _, _), text in zip(clusters, post_contents):
+                first_texts.setdefault(key, text)
+            model_inputs = [first_texts[key] for key, _, _ in clusters]
+        else:
+            clusters = [(None, None, None)] * len(post_contents)
+            model_inputs = post_contents
 
         # Perform sentiment analysis using TextBlob
-        sentiment_results = [TextBlob(content).sentiment.polarity for content in post_contents]
+        sentiment_future = stage_executor.submit(metrics.timed, 'sentiment', len(batch), cached_scores, model_inputs,
+                                                 sentiment_polarities, 'textblob', version('textblob'))
 
         # Perform zero-shot classification in batch
         try:
-            classification_results = classifier(post_contents, candidate_labels)
+            with metrics.stage('zero_shot', len(batch)):
+                classification_results = zero_shot_results(model_inputs)
         except Exception as e:
             logging.error(f"Error during classification: {e}")
+            drop_remote_backend(e)
+            if strict:
+                stage_executor.shutdown()
+                raise
             classification_results = []
 
         # Perform emotion classification in batch
         try:
-            emotion_results = emotion_pipeline(post_contents)
+            with metrics.stage('emotions', len(batch)):
+                emotion_results = cached_scores(model_inputs, emotion_model_scores,
+                                                f'{inference_backend}:{EMOTION_MODEL}', model_revision('emotion'))
         except Exception as e:
             logging.error(f"Error during emotion classification: {e}")
+            drop_remote_backend(e)
+            if strict:
+                stage_executor.shutdown()
+                raise
             emotion_results = []
 
+        sentiment_results = sentiment_future.result()
+
+        heuristics_start = time.perf_counter()
         for j, item in enumerate(batch):
             post_content = item['post_content'].lower() if pd.notna(item['post_content']) else ""
+            k = i + j
 
             # Sentiment analysis
             sentiment_label = "neutral"
@@ -133,7 +318,7 @@ def categorize_comments(data):
                     labels = classification_results[j]['labels']
 
                     for score, label in zip(scores, labels):
-                        if score > 0.3:  # Adjust threshold for feature request detection
+                        if score > zero_shot_threshold:  # Adjust threshold for feature request detection
                             if label == "feature request":
                                 feature_request = "yes"
                             else:
@@ -142,7 +327,8 @@ def categorize_comments(data):
                     logging.error(f"Error processing classification result: {e}")
 
             # Manual keyword matching for technical categories
-            detected_technical_issues, keyword_matches = detect_keywords_with_matches(post_content, technical_keywords)
+            detected_technical_issues = rule_results['technical_keywords'][k]
+            keyword_matches = rule_results['technical_keywords_matches'][k]
             if detected_technical_issues:
                 technical_issues.extend(detected_technical_issues)
 
@@ -169,55 +355,27 @@ def categorize_comments(data):
                     logging.error(f"Error processing emotion result: {e}")
 
             # Manual keyword matching for emotion analysis
-            for emotion, keywords in emotion_keywords.items():
-                if any(keyword in post_content for keyword in keywords):
-                    dominant_emotion = emotion
-                    break
+            if rule_results['emotions'][k]:
+                dominant_emotion = rule_results['emotions'][k]
 
-            # Detect countries
-            detected_countries = [country for country in countries if country.lower() in post_content]
-
-            # Detect iMOW models
-            detected_imow_models = detect_keywords(post_content, imow_models)
+            # Detect countries and iMOW models
+            detected_countries = rule_results['countries'][k]
+            detected_imow_models = rule_results['imow_models'][k]
 
             # Detect questions
-            questions = []
-            if any(word in post_content for word in ["what", "why", "how", "where", "when", "which"]):
-                if re.search(technical_keywords["hardware"], post_content):
-                    questions.append("hardware")
-                elif re.search(technical_keywords["connectivity"], post_content):
-                    questions.append("connectivity")
-                elif re.search(technical_keywords["installation"], post_content):
-                    questions.append("installation")
-                elif re.search(technical_keywords["software"], post_content):
-                    questions.append("software")
-                else:
-                    questions.append("general")
-
-            # Detect solutions
-            solutions = []
-            if any(word in post_content for word in ["solution", "resolved", "fix", "answer"]) or item.get('reference'):
-                solutions.append("solution")
-
-            # Detect replacements
-            replacements = []
-            if any(word in post_content for word in ["updated", "changed", "replaced", "alternative"]):
-                replacements.append("replaced")
-
-            # Detect comparisons
-            comparisons = []
-            if any(word in post_content for word in ["comparison", "updated", "alternative"]):
-                comparisons.append("comparison")
-
-            # Detect complaints
-            complaints = []
-            if any(word in post_content for word in ["angry", "issue", "problem", "complaint"]):
-                complaints.append("complaint")
+            questions = [rule_results['questions'][k]] if rule_results['questions'][k] else []
+
+            # Detect solutions, replacements, comparisons and complaints
+            solutions = rule_results['solution'][k] or (["solution"] if item.get('reference') else [])
+            replacements = rule_results['replaced'][k]
+            comparisons = rule_results['comparison'][k]
+            complaints = rule_results['complaints'][k]
 
             # Append categorized data with keyword matches for technical issues
             categorized_data.append({
                 'thread_title': item['thread_title'],
                 'post_author': item['post_author'],
+                'post_date': item.get('post_date'),
                 'thread_url': item['thread_url'],
                 'post_content': item['post_content'],
                 'sentiment': sentiment_label,
@@ -232,14 +390,109 @@ def categorize_comments(data):
                 'replaced': ', '.join(set(replacements)),
                 'feature_request': feature_request,
                 'comparison': ', '.join(set(comparisons)),
-                'complaints': ', '.join(set(complaints))
+                'complaints': ', '.join(set(complaints)),
+                # Key of the representative in dedup_index_file for a near-duplicate, for reference only
+                'duplicate_of': clusters[j][1] if clusters[j][1] != clusters[j][0] else ''
             })
 
             processed_items += 1
-            logging.info(f"Processed {processed_items}/{total_items} items")
 
+        metrics.observe_stage('heuristics', time.perf_counter() - heuristics_start, len(batch))
+        metrics.observe_stage('batch', time.perf_counter() - batch_start, len(batch))
+        metrics.progress(processed_items, total_items)
+
+    stage_executor.shutdown()
+    if _cascade:
+        _cascade.log_report()
+    return categorized_data
+
+# Function to set up a worker process before it loads any model: its thread budget and the parent's settings
+# The BLAS thread limits come with the environment from worker_pool, numpy is loaded before this runs
+def init_worker(threads, settings):
+    global intra_op_threads, inter_op_threads
+    globals().update(settings)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+    intra_op_threads = threads
+    inter_op_threads = 1
+
+# Function run in a worker process: the results of a shard and the timings of its stages for the parent's metrics
+def categorize_shard(data):
+    metrics = new_metrics()
+    return categorize_comments(data, metrics), metrics.state()
+
+# Function to categorize comments in nlp_workers processes, the results come back in input order
+# The timings of all shards go to metrics; without metrics the call logs one summary table at the end
+def categorize_comments_parallel(data, metrics=None):
+    summarize = metrics is None
+    metrics = metrics or new_metrics()
+    # A few shards per process, so a process that finishes early picks up more work
+    shard_size = max(batch_size, math.ceil(len(data) / (nlp_workers * 4)))
+    shards = [data[i:i + shard_size] for i in range(0, len(data), shard_size)]
+
+    categorized_data = []
+    with worker_pool() as executor:
+        for shard_results, shard_metrics in executor.map(categorize_shard, shards):
+            categorized_data.extend(shard_results)
+            metrics.merge(shard_metrics)
+    if summarize:
+        metrics.log_summary()
     return categorized_data
 
+# Function to start nlp_workers processes with their share of the cores and the settings of this one
+# torch and the BLAS libraries read the thread limits when a process loads them, which a spawned process does
+# while importing this script, so the limits are set in the environment it starts with. This process has
+# loaded them already; its own values are put back when the pool closes.
+@contextmanager
+def worker_pool():
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // nlp_workers)
+    settings = {name: globals()[name] for name in WORKER_SETTINGS}
+    saved = {variable: os.environ.get(variable) for variable in THREAD_VARIABLES}
+    os.environ.update({variable: str(threads) for variable in THREAD_VARIABLES})
+    try:
+        # spawn starts clean processes without copies of loaded models or open files, on every platform
+        with ProcessPoolExecutor(max_workers=nlp_workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker, initargs=(threads, settings)) as executor:
+            yield executor
+    finally:
+        for variable, value in saved.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+
+# Function to pick the parallel mode when it pays off
+def categorize(data):
+    if nlp_workers > 1 and len(data) > batch_size:
+        return categorize_comments_parallel(data)
+    return categorize_comments(data)
+
+# Generator categorizing chunks of posts as they are read, yields (chunk, results) in input order
+# Only a few chunks are held at a time (two per process with nlp_workers), however long the input is.
+# The timings of all chunks go to one summary table, logged once every chunk is done.
+def categorize_chunks(chunks):
+    metrics = new_metrics()
+    if nlp_workers <= 1:
+        for chunk in chunks:
+            yield chunk, categorize_comments(chunk, metrics)
+        metrics.log_summary()
+        return
+    pending = deque()
+    with worker_pool() as executor:
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(categorize_shard, chunk)))
+            if len(pending) >= nlp_workers * 2:
+                chunk, future = pending.popleft()
+                categorized_data, shard_metrics = future.result()
+                metrics.merge(shard_metrics)
+                yield chunk, categorized_data
+        while pending:
+            chunk, future = pending.popleft()
+            categorized_data, shard_metrics = future.result()
+            metrics.merge(shard_metrics)
+            yield chunk, categorized_data
+    metrics.log_summary()
+
 def process_new_data(excel_file, output_file, last_processed_index):
     try:
         # Load the crawled data from the existing Excel file
@@ -258,7 +511,7 @@ def process_new_data(excel_file, output_file, last_processed_index):
             return last_processed_index
 
         # Process comments to categorize them
-        categorized_data = categorize_comments(new_data.to_dict('records'))
+        categorized_data = categorize(new_data.to_dict('records'))
 
         # Convert categorized data to DataFrame
         categorized_df = pd.DataFrame(categorized_data)
@@ -274,6 +527,9 @@ def process_new_data(excel_file, output_file, last_processed_index):
 
         # Save the updated DataFrame to a new Excel file
         final_df.to_excel(output_file, index=False)
+        # The rollup is counted again from the whole output, there is no store to keep it up to date
+        final_rows = final_df.astype(object).where(pd.notna(final_df), None).to_dict('records')
+        write_excel(rollup_frame(final_rows), rollup_file_name(output_file))
 
         # Update last processed index
         last_processed_index = data.index.max() + 1
@@ -287,17 +543,233 @@ def process_new_data(excel_file, output_file, last_processed_index):
 
     return last_processed_index
 
-def main():
-    excel_file = "C:\\Users\\Vishwas Goswami\\OneDrive\\Documents\\Final Thesis\\Web Crawled.xlsx"
-    output_file = 'NLP Analysis.xlsx'
+# Function to recompute the whole output from the inference cache, after changing thresholds or rules
+# Every post of the crawl store is classified again in chunks and replaces its old results in the analysis store
+# through commit_batch, which keeps the rollup in step; the consumer's offset does not move. output_file and
+# its rollup are then exported from the store.
+def rebuild_output():
+    analysis_store = AnalysisStore(analysis_store_file)
+    try:
+        posts = 0
+        for chunk, categorized_data in categorize_chunks(read_store_chunks(post_store_file, backfill_chunk_size)):
+            for post, row in zip(chunk, categorized_data):
+                row['post_id'] = post['id']
+            analysis_store.commit_batch(categorized_data)
+            posts += len(chunk)
+        logging.info(f"Rebuilt the results of {posts} posts in {analysis_store_file}")
+        analysis_store.export_excel(output_file)
+    finally:
+        analysis_store.close()
+
+# Function to classify the posts added to the crawl store after the committed offset, one commit per micro-batch
+# Returns the number of posts classified
+def consume_new_posts(post_store, analysis_store):
+    processed = 0
+    # One summary table for all the micro-batches until the consumer has caught up
+    metrics = new_metrics()
+    while True:
+        posts = post_store.posts_after(analysis_store.offset(), consumer_batch_size)
+        if not posts:
+            if processed:
+                metrics.log_summary()
+            return processed
+        # In this process, so the models stay loaded between micro-batches. A failed model stage raises, so
+        # the batch is not committed without its labels
+        categorized_data = categorize_comments(posts, metrics, strict=True)
+        for post, row in zip(posts, categorized_data):
+            row['post_id'] = post['id']
+        # Results and offset are committed together, a crash before this line classifies the batch again
+        analysis_store.commit_batch(categorized_data, posts[-1]['id'])
+        processed += len(posts)
+        logging.info(f"Committed {len(posts)} posts up to id {posts[-1]['id']}")
+
+# Function to follow the crawl store and classify new posts within seconds of the crawler writing them
+def consume():
+    post_store = PostStore(post_store_file)
+    analysis_store = AnalysisStore(analysis_store_file)
+    logging.info(f"Consuming {post_store_file} from post id {analysis_store.offset()}")
+    last_export = time.monotonic()
+    failures = 0
+    try:
+        while True:
+            try:
+                processed = consume_new_posts(post_store, analysis_store)
+                failures = 0
+            except Exception as e:
+                # The offset stays where it was, the same posts are classified again on the next try
+                failures += 1
+                if consumer_max_failures is not None and failures >= consumer_max_failures:
+                    logging.error(f"Stopping the consumer after {failures} failed batches in a row, "
+                                  f"nothing after post id {analysis_store.offset()} was committed")
+                    raise
+                delay = min(consumer_poll_interval * 2 ** failures, 300)
+                logging.error(f"Batch after post id {analysis_store.offset()} failed ({e}), "
+                              f"not committed, retrying in {delay} s")
+                time.sleep(delay)
+                continue
+            if export_interval and processed and time.monotonic() - last_export >= export_interval:
+                analysis_store.export_excel(output_file)
+                last_export = time.monotonic()
+            if not processed:
+                time.sleep(consumer_poll_interval)
+    finally:
+        post_store.close()
+        analysis_store.close()
+
+# Generator reading the crawl store in chunks, starting after the post with id last_id
+def read_store_chunks(file_name, chunk_size, last_id=0):
+    store = PostStore(file_name)
+    try:
+        while True:
+            posts = store.posts_after(last_id, chunk_size)
+            if not posts:
+                return
+            last_id = posts[-1]['id']
+            yield posts
+    finally:
+        store.close()
+
+# Generator reading the rows of a workbook in chunks without loading the whole sheet, after skip_rows rows
+def read_excel_chunks(file_name, chunk_size, skip_rows=0):
+    workbook = load_workbook(file_name, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows)
+        chunk = []
+        for row in itertools.islice(rows, skip_rows, None):
+            chunk.append(dict(zip(header, row)))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+# Function to write a file through a temporary one, so a crash never leaves half a file behind
+def replace_file(file_name, write):
+    root, extension = os.path.splitext(file_name)
+    temp_file = f'{root}.tmp{extension}'
+    write(temp_file)
+    os.replace(temp_file, file_name)
+
+# Function to re-analyse a whole history (the crawl store or a workbook) chunk by chunk in constant memory
+#
+# Every chunk is written to its own workbook in backfill_dir as soon as it is done, then progress.json records
+# it. A stopped backfill continues with the chunk after the last one recorded; a chunk that was written but
+# not recorded is simply written again. A backfill of the crawl store also replaces the results of its posts in
+# the analysis store through commit_batch, so the store and its rollup show the new results too.
+def backfill(source):
+    os.makedirs(backfill_dir, exist_ok=True)
+    progress_file = os.path.join(backfill_dir, 'progress.json')
+    progress = {'source': os.path.abspath(source), 'chunk_size': backfill_chunk_size, 'chunks': 0, 'rows': 0,
+                'last_id': 0}
+    if os.path.exists(progress_file):
+        with open(progress_file, 'r') as f:
+            saved = json.load(f)
+        if (saved['source'], saved['chunk_size']) != (progress['source'], progress['chunk_size']):
+            logging.error(f"{backfill_dir} holds a backfill of {saved['source']} in chunks of {saved['chunk_size']}. "
+                          f"Empty the folder to start a new one.")
+            return
+        progress = saved
+        logging.info(f"Resuming backfill after chunk {progress['chunks']} ({progress['rows']} posts)")
+
+    analysis_store = None
+    if source.endswith('.sqlite'):
+        chunks = read_store_chunks(source, backfill_chunk_size, progress['last_id'])
+        if os.path.abspath(source) == os.path.abspath(post_store_file):
+            analysis_store = AnalysisStore(analysis_store_file)
+    else:
+        chunks = read_excel_chunks(source, backfill_chunk_size, progress['rows'])
+
+    def write_progress(temp_file):
+        with open(temp_file, 'w') as f:
+            json.dump(progress, f, indent=2)
+
+    try:
+        for chunk, categorized_data in categorize_chunks(chunks):
+            if analysis_store is not None:
+                for post, row in zip(chunk, categorized_data):
+                    row['post_id'] = post['id']
+                analysis_store.commit_batch(categorized_data)
+            part_file = os.path.join(backfill_dir, f"part-{progress['chunks']:05d}.xlsx")
+            replace_file(part_file, lambda temp_file: pd.DataFrame(categorized_data, columns=ANALYSIS_COLUMNS)
+                         .to_excel(temp_file, index=False))
+            progress['chunks'] += 1
+            progress['rows'] += len(chunk)
+            progress['last_id'] = chunk[-1].get('id', 0)
+            replace_file(progress_file, write_progress)
+            logging.info(f"Backfill wrote {part_file}, {progress['rows']} posts so far")
+    finally:
+        if analysis_store is not None:
+            analysis_store.close()
+    logging.info(f"Backfill complete: {progress['rows']} posts in {progress['chunks']} files in {backfill_dir}")
+
+# Function to train the fast tier of the cascade on the posts of the crawl store the zero-shot model has scored
+def train_cascade(file_name=None, min_posts=500):
+    inference_cache = get_inference_cache()
+    if inference_cache is None:
+        logging.error("The cascade learns from the inference cache, set inference_cache_file")
+        return None
+    texts = []
+    results = []
+    seen = set()
+    revision = model_revision('zero_shot')
+    for posts in read_store_chunks(post_store_file, backfill_chunk_size):
+        keys = {}
+        for post in posts:
+            text = str(post['post_content']) if pd.notna(post['post_content']) else ""
+            key = InferenceCache.key(zero_shot_model_id(), revision, candidate_labels, text)
+            if key not in seen:
+                keys[key] = text
+        seen.update(keys)
+        for key, result in inference_cache.get_many(list(keys)).items():
+            texts.append(keys[key])
+            results.append(result)
+    if len(texts) < min_posts:
+        logging.error(f"Only {len(texts)} posts with zero-shot scores, the cascade needs at least {min_posts}")
+        return None
+
+    classifier, evaluation = train_fast_classifier(texts, results, candidate_labels, zero_shot_threshold,
+                                                   cascade_confidence, cascade_max_chars)
+    file_name = file_name or cascade_model_file or 'cascade_model.pkl'
+    classifier.save(file_name)
+    logging.info(f"Trained {file_name} on {len(texts)} posts. On {evaluation['test_posts']} held-out posts the fast "
+                 f"tier answers {evaluation['coverage']:.0%} with agreement {evaluation['agreement']}")
+    return evaluation
+
+# Function to process the Excel file of the crawler every 2 hours, for setups without the crawl store
+def watch_excel():
     last_processed_index = 0  # Initialize this with the index of the last processed row
 
     while True:
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(process_new_data, excel_file, output_file, last_processed_index)
-            last_processed_index = future.result()
-        
+        # Parallelism comes from nlp_workers, the run itself needs no extra thread
+        last_processed_index = process_new_data(excel_file, output_file, last_processed_index)
+
         time.sleep(2 * 60 * 60)  # Wait for 2 hours
 
+def main():
+    consume()
+
 if __name__ == "__main__":
-    main()
+    # python NLP.py --rebuild re-applies the rules to every post, models only run for posts not in the cache
+    # python NLP.py --export writes output_file from the analysis store
+    # python NLP.py --excel processes excel_file every 2 hours instead of following the crawl store
+    # python NLP.py --backfill [crawl store or workbook] re-analyses a whole history into backfill_dir
+    # python NLP.py --train-cascade [model file] trains the fast tier of the cascade
+    if '--train-cascade' in sys.argv[1:]:
+        arguments = sys.argv[sys.argv.index('--train-cascade') + 1:]
+        train_cascade(arguments[0] if arguments else None)
+    elif '--backfill' in sys.argv[1:]:
+        arguments = sys.argv[sys.argv.index('--backfill') + 1:]
+        backfill(arguments[0] if arguments else post_store_file)
+    elif '--rebuild' in sys.argv[1:]:
+        rebuild_output()
+    elif '--export' in sys.argv[1:]:
+        analysis_store = AnalysisStore(analysis_store_file)
+        analysis_store.export_excel(output_file)
+        analysis_store.close()
+    elif '--excel' in sys.argv[1:]:
+        watch_excel()
+    else:
+        main()
@@ -0,0 +1,152 @@
+import cProfile
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Upper ends of the post length buckets in words; the models read at most 512 tokens of a post
+LENGTH_BUCKETS = [16, 64, 128, 256, 512]
+
+
+# Timings of categorize_comments by stage and batch, the progress lines and the summary table of a run
+#
+# Stages of every batch:
+#   dedup        near-duplicate lookup of the posts
+#   sentiment    TextBlob polarity, runs in a thread next to the models
+#   zero_shot    zero-shot labels (or the cascade)
+#   emotions     emotion model
+#   heuristics   rules and labels of every post, out of the model scores and the rule columns
+#   batch        wall time of the whole batch
+# plus 'rules', the rule engine over all posts of a call at once. Every stage keeps the seconds and items
+# of each call, which give items per second and the spread between batches. Post lengths are counted in
+# words, a cheap stand-in for the model tokens.
+#
+# hooks are functions called with (stage, seconds, items) after every stage, e.g. to feed a monitoring
+# system. Worker processes send their raw timings back with state(), the parent adds them with merge(). With profile_file set, profile() runs cProfile and writes its stats there (pstats format, e.g.
+# for snakeviz); only the thread that calls it is profiled.
+class NLPMetrics:
+    def __init__(self, progress_interval=30, profile_file=None, hooks=()):
+        self.lock = threading.Lock()
+        self.progress_interval = progress_interval
+        self.profile_file = profile_file
+        self.hooks = list(hooks)
+        self.started = time.perf_counter()
+        self.last_progress = self.started
+        self.stages = {}
+        self.lengths = []
+        self.profiler = None
+
+    def observe_stage(self, stage, seconds, items):
+        with self.lock:
+            self.stages.setdefault(stage, []).append((seconds, items))
+        for hook in self.hooks:
+            hook(stage, seconds, items)
+
+    @contextmanager
+    def stage(self, stage, items):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start, items)
+
+    # Calls function(*args) and adds its time to the stage, for the stages that run in a thread
+    def timed(self, stage, items, function, *args):
+        with self.stage(stage, items):
+            return function(*args)
+
+    def observe_lengths(self, texts):
+        lengths = [len(text.split()) for text in texts]
+        with self.lock:
+            self.lengths.extend(lengths)
+
+    def state(self):
+        with self.lock:
+            return {'stages': {stage: list(calls) for stage, calls in self.stages.items()},
+                    'lengths': list(self.lengths)}
+
+    # The hooks already ran in the process the state comes from
+    def merge(self, state):
+        with self.lock:
+            for stage, calls in state['stages'].items():
+                self.stages.setdefault(stage, []).extend(calls)
+            self.lengths.extend(state['lengths'])
+
+    # Logs a progress line at most every progress_interval seconds, instead of one per post
+    def progress(self, done, total):
+        now = time.perf_counter()
+        if now - self.last_progress < self.progress_interval:
+            return
+        self.last_progress = now
+        batches = self.stages.get('batch', [])
+        seconds = sum(seconds for seconds, _ in batches)
+        rate = sum(items for _, items in batches) / seconds if seconds else 0.0
+        logging.info(f"Processed {done}/{total} items, {rate:.1f} items/s")
+
+    @contextmanager
+    def profile(self):
+        if not self.profile_file:
+            yield
+            return
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+            self.write_profile()
+
+    # Worker processes write next to the file, with their process id in the name
+    def write_profile(self):
+        file_name = self.profile_file
+        if multiprocessing.current_process().name != 'MainProcess':
+            root, extension = os.path.splitext(file_name)
+            file_name = f'{root}-{os.getpid()}{extension}'
+        self.profiler.dump_stats(file_name)
+
+    def snapshot(self):
+        with self.lock:
+            stages = {}
+            for stage, calls in self.stages.items():
+                seconds = np.array([seconds for seconds, _ in calls])
+                items = sum(items for _, items in calls)
+                stages[stage] = {
+                    'calls': len(calls),
+                    'items': items,
+                    'seconds': round(float(seconds.sum()), 6),
+                    'items_per_second': round(items / seconds.sum(), 1) if seconds.sum() else 0.0,
+                    'ms_per_call_p50': round(float(np.percentile(seconds, 50)) * 1000, 2),
+                    'ms_per_call_p95': round(float(np.percentile(seconds, 95)) * 1000, 2),
+                }
+            lengths = np.array(self.lengths)
+        length_summary = {'posts': len(lengths)}
+        if len(lengths):
+            length_summary.update({f'p{q}': int(np.percentile(lengths, q)) for q in (50, 90, 99)})
+            length_summary['max'] = int(lengths.max())
+            counts = np.bincount(np.searchsorted(LENGTH_BUCKETS, lengths), minlength=len(LENGTH_BUCKETS) + 1)
+            names = [f'<={bucket}' for bucket in LENGTH_BUCKETS] + [f'>{LENGTH_BUCKETS[-1]}']
+            length_summary['buckets'] = dict(zip(names, counts.tolist()))
+        return {'duration_seconds': round(time.perf_counter() - self.started, 6), 'stages': stages,
+                'lengths': length_summary}
+
+    def summary(self):
+        snapshot = self.snapshot()
+        lines = [f"{'stage':<12}{'calls':>7}{'items':>8}{'seconds':>10}{'items/s':>10}{'p50 ms':>10}{'p95 ms':>10}"]
+        for stage, stats in snapshot['stages'].items():
+            lines.append(f"{stage:<12}{stats['calls']:>7}{stats['items']:>8}{stats['seconds']:>10.3f}"
+                         f"{stats['items_per_second']:>10.1f}{stats['ms_per_call_p50']:>10.1f}"
+                         f"{stats['ms_per_call_p95']:>10.1f}")
+        lengths = snapshot['lengths']
+        if lengths['posts']:
+            buckets = ', '.join(f'{name}: {count}' for name, count in lengths['buckets'].items())
+            lines.append(f"Post length in words: p50 {lengths['p50']}, p90 {lengths['p90']}, p99 {lengths['p99']}, "
+                         f"max {lengths['max']} ({buckets})")
+        return '\n'.join(lines)
+
+    def log_summary(self):
+        logging.info(f"categorize_comments in {self.snapshot()['duration_seconds']:.1f} s\n{self.summary()}")
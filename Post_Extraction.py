@@ -0,0 +1,216 @@
+import re
+from datetime import datetime
+
+from lxml import etree
+
+
+# XPath for "any descendant with this tag and class", matching class tokens like BeautifulSoup's class_
+def has_class(tag, class_name):
+    return f".//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+
+# Selectors are compiled once and reused for every page
+find_messages = etree.XPath(has_class('article', 'message'))
+find_thread_titles = etree.XPath(has_class('div', 'structItem-title'))
+find_page_links = etree.XPath(
+    ".//ul[contains(concat(' ', normalize-space(@class), ' '), ' pageNav-main ')]"
+    "//li[contains(concat(' ', normalize-space(@class), ' '), ' pageNav-page ')]//a"
+)
+find_attribution = etree.XPath(has_class('ul', 'message-attribution-opposite'))
+find_list_items = etree.XPath('.//li')
+find_time = etree.XPath('.//time')
+find_reactions_bar = etree.XPath(has_class('div', 'reactionsBar'))
+find_reactions_link = etree.XPath(has_class('a', 'reactionsBar-link'))
+find_blockquotes = etree.XPath('.//blockquote')
+find_hrefs = etree.XPath('.//a/@href')
+find_bbWrapper = etree.XPath(has_class('div', 'bbWrapper'))
+find_bbCodeBlocks = etree.XPath(has_class('div', 'bbCodeBlock'))
+find_links = etree.XPath('.//a[@href]')
+find_thread_item = etree.XPath(
+    "ancestor::div[contains(concat(' ', normalize-space(@class), ' '), ' structItem ')][1]"
+)
+find_reply_count = etree.XPath(
+    ".//div[contains(concat(' ', normalize-space(@class), ' '), ' structItem-cell--meta ')]//dl[1]/dd"
+)
+find_latest_date = etree.XPath(has_class('time', 'structItem-latestDate'))
+
+# BeautifulSoup leaves the text of these tags out of get_text()
+SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}
+
+
+def parse_html(text):
+    root = etree.HTML(text)
+    # An empty document has no root, treat it as a page without content
+    return root if root is not None else etree.Element('html')
+
+
+# Text pieces of an element in document order, leaving out skipped subtrees but keeping their tails
+def iter_strings(element, skip=None):
+    if element.text and element.tag not in SKIPPED_TEXT_TAGS:
+        yield element.text
+    for child in element:
+        # Comments and processing instructions have no string tag and their text is not content
+        if isinstance(child.tag, str) and not (skip and child in skip):
+            yield from iter_strings(child, skip)
+        if child.tail:
+            yield child.tail
+
+
+# Same result as BeautifulSoup's get_text(separator, strip=True)
+def get_text(element, separator=' ', skip=None):
+    return separator.join(text.strip() for text in iter_strings(element, skip) if text.strip())
+
+
+def first(elements):
+    return elements[0] if elements else None
+
+
+# Counts as XenForo prints them: "12", "1.234", "1,2K"
+def parse_count(text):
+    text = text.strip().upper()
+    multiplier = 1
+    if text.endswith('K'):
+        multiplier, text = 1000, text[:-1]
+    elif text.endswith('M'):
+        multiplier, text = 1000000, text[:-1]
+    try:
+        if multiplier > 1:
+            return int(float(text.replace(',', '.')) * multiplier)
+        return int(text.replace('.', '').replace(',', ''))
+    except ValueError:
+        return None
+
+
+# Unix time of a <time> element, from data-time or else the ISO datetime attribute
+def parse_timestamp(data_time, iso_datetime):
+    if data_time and data_time.isdigit():
+        return int(data_time)
+    if iso_datetime:
+        try:
+            return int(datetime.fromisoformat(iso_datetime).timestamp())
+        except ValueError:
+            pass
+    return None
+
+
+# Thread links of a listing page with the reply count and last activity time of each thread
+def extract_listing_threads(root):
+    threads = []
+    for title in find_thread_titles(root):
+        link = first(find_links(title))
+        if link is None:
+            continue
+        replies = None
+        last_activity = None
+        item = first(find_thread_item(title))
+        if item is not None:
+            reply_count = first(find_reply_count(item))
+            if reply_count is not None:
+                replies = parse_count(get_text(reply_count, ''))
+            latest_date = first(find_latest_date(item))
+            if latest_date is not None:
+                last_activity = parse_timestamp(latest_date.get('data-time'), latest_date.get('datetime'))
+        threads.append({
+            'href': link.get('href'),
+            'title': ''.join(iter_strings(link)).strip(),
+            'replies': replies,
+            'last_activity': last_activity
+        })
+    return threads
+
+
+# Post number from the "#N" sequence label, None when the label is missing
+def post_number(post_sequence):
+    digits = re.sub(r'\D', '', post_sequence or '')
+    return int(digits) if digits else None
+
+
+def extract_last_page(root):
+    last_page = 1
+    for link in find_page_links(root):
+        text = get_text(link, '')
+        if text.isdigit():
+            last_page = max(last_page, int(text))
+    return last_page
+
+
+def extract_first_post_text(root):
+    first_post = first(find_messages(root))
+    if first_post is not None:
+        content = first(find_bbWrapper(first_post))
+        return get_text(content) if content is not None else ''
+    return ''
+
+
+# All post fields of a thread page in one pass over each article.message, without mutating the tree
+def extract_posts(root, first_post_date):
+    posts_data = []
+    for post in find_messages(root):
+        post_sequence = None
+        post_sequence_element = first(find_attribution(post))
+        if post_sequence_element is not None:
+            post_sequence = ''.join(iter_strings(find_list_items(post_sequence_element)[1])).strip()
+
+        post_author = post.get('data-author', '')
+        time_element = first(find_time(post))
+        post_date = time_element.attrib['datetime'] if time_element is not None else ''
+        if not first_post_date:
+            first_post_date = post_date
+
+        post_reactions_count = 0
+        reactions_bar = first(find_reactions_bar(post))
+        if reactions_bar is not None:
+            reactions_link = first(find_reactions_link(reactions_bar))
+            if reactions_link is not None:
+                post_reactions_text = get_text(reactions_link, '')
+                post_reactions_count = len(re.split(r',|und', post_reactions_text))
+
+        # Extract quotes and references
+        blockquotes = find_blockquotes(post)
+        responses_count = len(blockquotes)
+        response_to = [quote.get('data-quote', '') for quote in blockquotes]
+
+        references = [str(href) for href in find_hrefs(post) if 'http' in href]
+        references_text = ', '.join(references)
+
+        # Split the content into quotes, code blocks and the main text
+        post_content = first(find_bbWrapper(post))
+        if post_content is None:
+            continue
+        removed = set()
+        quote_texts = []
+        for quote in find_blockquotes(post_content):
+            # A quote nested in one that was already taken out comes back empty, as with decompose()
+            nested = any(ancestor in removed for ancestor in quote.iterancestors())
+            quote_texts.append('' if nested else get_text(quote))
+            removed.add(quote)
+
+        bbCodeBlock_texts = []
+        for bb_code in find_bbCodeBlocks(post_content):
+            if any(ancestor in removed for ancestor in bb_code.iterancestors()):
+                # The block sat inside a quote: it never existed in the cleaned tree
+                if any(ancestor.tag == 'blockquote' and ancestor in removed for ancestor in bb_code.iterancestors()):
+                    continue
+                bbCodeBlock_texts.append('')
+            else:
+                bbCodeBlock_texts.append(get_text(bb_code))
+            removed.add(bb_code)
+
+        removed.update(find_links(post_content))
+        post_content_cleaned = get_text(post_content, skip=removed)
+
+        if post_content_cleaned.strip():
+            posts_data.append({
+                'post_content': post_content_cleaned,
+                'post_author': post_author,
+                'post_date': post_date,
+                'post_sequence': post_sequence,
+                'post_reactions': post_reactions_count,
+                'first_post_date': first_post_date,
+                'response_to': ', '.join(response_to),
+                'references': references_text,
+                'responses_count': responses_count,
+                'quote_texts': quote_texts,
+                'bbCodeBlock_texts': bbCodeBlock_texts
+            })
+    return posts_data, first_post_date
@@ -0,0 +1,124 @@
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+# Columns of a crawled post, in the order of the Excel export
+POST_COLUMNS = [
+    'thread_title', 'post_content', 'post_author', 'post_date', 'post_sequence', 'post_reactions',
+    'first_post_date', 'response_to', 'references', 'responses_count', 'thread_url', 'platform',
+    'model', 'quote_text', 'bbCodeBlock_text'
+]
+
+
+# Append-only SQLite store for crawled posts and the running model counts
+#
+# Post ids only grow, so the store doubles as the queue the NLP consumer reads from (see posts_after).
+# WAL mode lets that consumer read while the crawler writes.
+class PostStore:
+    def __init__(self, file_name='crawl_store.sqlite'):
+        self.file_name = file_name
+        self.conn = sqlite3.connect(file_name, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        columns = ', '.join(f'"{column}"' for column in POST_COLUMNS)
+        self.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS posts (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns}, '
+            'UNIQUE (thread_url, post_sequence))'
+        )
+        # SQLite treats NULLs as distinct in the UNIQUE constraint, posts without a "#N" label are matched on this
+        self.conn.execute('CREATE INDEX IF NOT EXISTS posts_unnumbered ON posts (thread_url, post_author, post_date) '
+                          'WHERE post_sequence IS NULL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS model_counts (model TEXT PRIMARY KEY, count INTEGER NOT NULL)')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    # Returns the number of rows that were new; posts already stored for (thread_url, post_sequence) are skipped,
+    # and so are posts without a sequence already stored for (thread_url, post_author, post_date)
+    def add_posts(self, records):
+        columns = ', '.join(f'"{column}"' for column in POST_COLUMNS)
+        placeholders = ', '.join('?' * len(POST_COLUMNS))
+        numbered = [record for record in records if record.get('post_sequence') is not None]
+        unnumbered = [record for record in records if record.get('post_sequence') is None]
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                f'INSERT OR IGNORE INTO posts ({columns}) VALUES ({placeholders})',
+                [tuple(record.get(column) for column in POST_COLUMNS) for record in numbered]
+            )
+            self.conn.executemany(
+                f'INSERT INTO posts ({columns}) SELECT {placeholders} WHERE NOT EXISTS ('
+                'SELECT 1 FROM posts WHERE post_sequence IS NULL AND thread_url IS ? AND post_author IS ? '
+                'AND post_date IS ?)',
+                [tuple(record.get(column) for column in POST_COLUMNS)
+                 + (record.get('thread_url'), record.get('post_author'), record.get('post_date'))
+                 for record in unnumbered]
+            )
+        return self.conn.total_changes - before
+
+    def add_model_counts(self, model_counts):
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO model_counts (model, count) VALUES (?, ?) '
+                'ON CONFLICT (model) DO UPDATE SET count = count + excluded.count',
+                list(model_counts.items())
+            )
+
+    # Posts with an id above last_id, oldest first, as dicts with their 'id'
+    #
+    # Only the crawler writes to the store, so ids become visible in order: once a reader has seen an id,
+    # no smaller one can show up later.
+    def posts_after(self, last_id, limit=None):
+        columns = ', '.join(f'"{column}"' for column in POST_COLUMNS)
+        cursor = self.conn.execute(f'SELECT id, {columns} FROM posts WHERE id > ? ORDER BY id LIMIT ?',
+                                   (last_id, limit or -1))
+        return [dict(zip(['id'] + POST_COLUMNS, row)) for row in cursor]
+
+    def post_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+
+    # One-off import of the history from the workbooks the crawler used to rewrite
+    def import_excel(self, file_name='Web Crawled.xlsx', model_file_name='modelCrawled.xlsx'):
+        if self.post_count() or not os.path.exists(file_name):
+            return 0
+        existing_data = pd.read_excel(file_name)
+        existing_data = existing_data.astype(object).where(existing_data.notna(), None)
+        rows_added = self.add_posts(existing_data.to_dict('records'))
+        if os.path.exists(model_file_name):
+            existing_model_counts = pd.read_excel(model_file_name, index_col=0).iloc[:, 0].to_dict()
+            self.add_model_counts({model: int(count) for model, count in existing_model_counts.items()})
+        logging.info(f"Imported {rows_added} rows from {file_name} into {self.file_name}")
+        return rows_added
+
+    # On-demand export of the workbooks the dashboard and the NLP script read
+    def export_excel(self, file_name='Web Crawled.xlsx', model_file_name='modelCrawled.xlsx', attempts=5):
+        columns = ', '.join(f'"{column}"' for column in POST_COLUMNS)
+        df = pd.read_sql_query(f'SELECT {columns} FROM posts ORDER BY id', self.conn)
+        model_counts = dict(self.conn.execute('SELECT model, count FROM model_counts ORDER BY model').fetchall())
+
+        for target, write in ((file_name, lambda: df.to_excel(file_name, index=False)),
+                              (model_file_name, lambda: pd.Series(model_counts).to_excel(model_file_name))):
+            for attempt in range(attempts):
+                try:
+                    write()
+                    break
+                except PermissionError:
+                    if attempt == attempts - 1:
+                        logging.error(f"Unable to save {target} because the file is open. Giving up, run the export again later.")
+                        return False
+                    logging.warning(f"Unable to save {target} because the file is open. Retrying in 20 seconds...")
+                    time.sleep(20)
+        logging.info(f"Exported {len(df)} rows to {file_name}")
+        return True
+
+
+if __name__ == '__main__':
+    # python Post_Store.py [store file] exports the Excel files for the dashboard
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = PostStore(sys.argv[1] if len(sys.argv) > 1 else 'crawl_store.sqlite')
+    store.export_excel()
+    store.close()
@@ -0,0 +1,213 @@
+import json
+import os
+import re
+
+import numpy as np
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nlp_rules.json')
+
+
+def load_rules(file_name=RULES_FILE):
+    with open(file_name, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Most literal clauses kept per pattern, further literals are left to the regex
+MAX_CLAUSES = 64
+
+
+# Literals required by a parsed pattern, as alternatives (clauses) of literals that all have to be present
+def sequence_literals(items):
+    clauses = [frozenset()]
+
+    def require(options):
+        nonlocal clauses
+        combined = {clause | option for clause in clauses for option in options}
+        if len(combined) <= MAX_CLAUSES:
+            clauses = list(combined)
+
+    run = ''
+    for op, value in items:
+        if op is sre_parse.LITERAL:
+            run += chr(value)
+            continue
+        if run:
+            require([frozenset([run])])
+            run = ''
+        if op is sre_parse.SUBPATTERN:
+            require(sequence_literals(value[-1]))
+        elif op is sre_parse.BRANCH:
+            require([clause for alternative in value[1] for clause in sequence_literals(alternative)])
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and value[0] >= 1:
+            require(sequence_literals(value[2]))
+        # Anything else (\b, classes, lookarounds, ...) only ends the current literal
+    if run:
+        require([frozenset([run])])
+    return clauses
+
+
+# Clauses of lowercase ASCII literals: a text can only match the pattern if it contains every literal of one
+# clause. None when some match needs no literal at all.
+#
+# r'\bstihl\s*imow\s*7\b|\bevo\s*7\b' gives [{'stihl', 'imow', '7'}, {'evo', '7'}].
+def required_literals(pattern):
+    try:
+        clauses = sequence_literals(sre_parse.parse(pattern))
+    except Exception:
+        return None
+    if not all(clauses) or not all(literal.isascii() for clause in clauses for literal in clause):
+        return None
+    clauses = {frozenset(literal.lower() for literal in clause) for clause in clauses}
+    # Literals inside longer literals of the same clause add nothing, e.g. 'app' next to 'imow app'
+    clauses = {frozenset(literal for literal in clause if not any(literal in other and literal != other
+                                                                  for other in clause))
+               for clause in clauses}
+    # Nor do clauses that imply another one: a text with 'application' also contains 'app'
+    return [clause for clause in clauses
+            if not any(other != clause and all(any(literal in own for own in clause) for literal in other)
+                       for other in clauses)]
+
+
+# re.ASCII copy of a pattern for ASCII texts; None when the pattern itself is not ASCII or sets (?u)
+def ascii_regex(pattern, flags):
+    if not pattern.isascii():
+        return None
+    try:
+        return re.compile(pattern, flags | re.ASCII)
+    except (re.error, ValueError):
+        return None
+
+
+# One rule family of nlp_rules.json, compiled once
+#
+# Family types:
+#   regex           every rule whose pattern is found; also keeps the first matching text of each rule
+#   contains        every rule with one of its words in the text
+#   first_regex     the first rule whose pattern is found, or default; only for texts containing a "when" word
+#   first_contains  the first rule with one of its words in the text, or None
+#
+# Words are plain substring checks over the whole column. A regex only runs on the texts that contain the
+# literals of one of its clauses (see required_literals), so most texts never reach the regex engine.
+# ASCII texts are searched with an re.ASCII copy of the regex, which matches the same there and skips the
+# Unicode case folding of ignore_case.
+class RuleFamily:
+    def __init__(self, family):
+        self.name = family['name']
+        self.type = family['type']
+        self.default = family.get('default')
+        self.when = family.get('when')
+        self.flags = re.IGNORECASE if family.get('ignore_case') else 0
+        self.rules = []
+        for rule in family['rules']:
+            if self.type in ('regex', 'first_regex'):
+                regex = re.compile(rule['pattern'], self.flags)
+                self.rules.append({'name': rule['name'], 'regex': regex,
+                                   'ascii_regex': ascii_regex(rule['pattern'], self.flags) or regex,
+                                   'literals': required_literals(rule['pattern'])})
+            else:
+                self.rules.append({'name': rule['name'], 'words': rule['words']})
+
+    def evaluate(self, column):
+        if self.type in ('regex', 'contains'):
+            results = [[] for _ in range(len(column.texts))]
+        else:
+            results = [None] * len(column.texts)
+        matches = [[] for _ in range(len(column.texts))] if self.type == 'regex' else None
+
+        # Positions of the texts still open to the rules
+        candidates = np.arange(len(column.texts))
+        if self.when is not None:
+            candidates = candidates[column.contains_any(self.when)]
+            for position in candidates:
+                results[position] = self.default
+
+        for rule in self.rules:
+            if not len(candidates):
+                break
+            if 'words' in rule:
+                hits = candidates[column.contains_any(rule['words'])[candidates]]
+            else:
+                possible = candidates
+                if rule['literals'] is not None:
+                    possible = candidates[column.may_match(rule['literals'])[candidates]]
+                texts = column.texts
+                found = []
+                for regex, positions in ((rule['ascii_regex'], possible[~column.non_ascii[possible]]),
+                                         (rule['regex'], possible[column.non_ascii[possible]])):
+                    search = regex.search
+                    found.extend((position, match) for position in positions.tolist()
+                                 for match in [search(texts[position])] if match)
+                if self.type == 'regex':
+                    for position, match in found:
+                        results[position].append(rule['name'])
+                        matches[position].append(match.group(0))
+                    continue
+                hits = np.array([position for position, _ in found], dtype=int)
+
+            if self.type == 'contains':
+                for position in hits:
+                    results[position].append(rule['name'])
+            else:
+                for position in hits:
+                    results[position] = rule['name']
+                # Texts keep the first rule that matched
+                candidates = np.setdiff1d(candidates, hits, assume_unique=True)
+        return results, matches
+
+
+# A column of texts with the substring checks of all families, each word searched for only once
+class TextColumn:
+    def __init__(self, texts):
+        self.texts = texts
+        self.lowered = [text.lower() for text in texts]
+        # The NLP script passes lowercased posts, then both kinds of checks share their results
+        self.already_lowered = self.lowered == texts
+        # Case folding of non-ASCII text is not covered by the lowercase literals, those texts always pass
+        self.non_ascii = np.array([not text.isascii() for text in texts], dtype=bool)
+        self.found = {}
+
+    def contains(self, word, lowered=False):
+        key = (word, lowered and not self.already_lowered)
+        if key not in self.found:
+            texts = self.lowered if lowered else self.texts
+            self.found[key] = np.fromiter((word in text for text in texts), dtype=bool, count=len(texts))
+        return self.found[key]
+
+    def contains_any(self, words):
+        mask = np.zeros(len(self.texts), dtype=bool)
+        for word in words:
+            mask |= self.contains(word)
+        return mask
+
+    def may_match(self, clauses):
+        mask = self.non_ascii.copy()
+        for clause in clauses:
+            clause_mask = np.ones(len(self.texts), dtype=bool)
+            for literal in clause:
+                clause_mask &= self.contains(literal, lowered=True)
+            mask |= clause_mask
+        return mask
+
+
+# Runs the keyword and heuristic rules of the NLP script over a whole column of texts at once
+#
+# evaluate(texts) returns a dict with one list per family, in the order of the texts, plus
+# "<family>_matches" with the matching texts of regex families. Rules are read from nlp_rules.json.
+class RuleEngine:
+    def __init__(self, rules=None):
+        rules = rules if rules is not None else load_rules()
+        self.families = [RuleFamily(family) for family in rules['families']]
+
+    def evaluate(self, texts):
+        column = TextColumn(list(texts))
+        results = {}
+        for family in self.families:
+            results[family.name], matches = family.evaluate(column)
+            if matches is not None:
+                results[family.name + '_matches'] = matches
+        return results
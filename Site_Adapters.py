@@ -0,0 +1,90 @@
+import re
+from urllib.parse import urljoin, urlsplit
+
+from Post_Extraction import (extract_first_post_text, extract_last_page, extract_listing_threads,
+                             extract_posts, parse_html, post_number)
+
+
+# What the crawler needs to know about a forum platform
+#
+# An adapter turns the pages of one forum section into:
+#   listing_threads(root)                 threads as {'url', 'title', 'replies', 'last_activity'}, newest activity first
+#   last_page(root)                       number of pages of a listing or thread, from its page navigation
+#   page_url(url, page)                   URL of a page of a listing or thread
+#   first_post_text(root)                 text of the first post, used to decide the model
+#   thread_posts(root, first_post_date)   (posts_data, first_post_date) with the fields of Post_Extraction.extract_posts
+#   post_number(post_sequence)            number of a post, for the per-thread watermark
+#
+# The platform name is stored with every post; it defaults to the host name without "www.".
+class SiteAdapter:
+    posts_per_page = 20
+
+    def __init__(self, forum_url, platform=None):
+        self.forum_url = forum_url
+        self.host = urlsplit(forum_url).netloc
+        self.platform = platform or re.sub(r'^www\.', '', self.host)
+
+    def parse(self, text):
+        return parse_html(text)
+
+    def listing_threads(self, root):
+        raise NotImplementedError
+
+    def last_page(self, root):
+        raise NotImplementedError
+
+    def page_url(self, url, page):
+        raise NotImplementedError
+
+    def first_post_text(self, root):
+        raise NotImplementedError
+
+    def thread_posts(self, root, first_post_date):
+        raise NotImplementedError
+
+    def post_number(self, post_sequence):
+        return post_number(post_sequence)
+
+    # URLs of the pages after start_page, so they can be fetched in parallel
+    def page_urls(self, root, url, start_page=1):
+        return [self.page_url(url, page) for page in range(start_page + 1, self.last_page(root) + 1)]
+
+
+# XenForo forums such as roboter-forum.com; the selectors live in Post_Extraction.py
+class XenForoAdapter(SiteAdapter):
+    def listing_threads(self, root):
+        threads = []
+        for thread in extract_listing_threads(root):
+            thread['url'] = urljoin(self.forum_url, thread.pop('href'))
+            threads.append(thread)
+        return threads
+
+    def last_page(self, root):
+        return extract_last_page(root)
+
+    # Page 1 is the plain URL, later pages end in /page-N
+    def page_url(self, url, page):
+        if page == 1:
+            return url
+        base_url = re.sub(r'page-\d+/?$', '', url)
+        if not base_url.endswith('/'):
+            base_url += '/'
+        return f'{base_url}page-{page}'
+
+    def first_post_text(self, root):
+        return extract_first_post_text(root)
+
+    def thread_posts(self, root, first_post_date):
+        return extract_posts(root, first_post_date)
+
+
+# Adapters by the name used in the sites setting of Web_Crawling.py
+ADAPTERS = {
+    'xenforo': XenForoAdapter,
+}
+
+
+def make_adapter(site):
+    site = dict(site)
+    adapter_class = ADAPTERS[site.pop('engine', 'xenforo')]
+    return adapter_class(**site)
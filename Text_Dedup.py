@@ -0,0 +1,160 @@
+import hashlib
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+# Hash values are taken modulo this prime, so a * hash + b stays within 64 bits
+PRIME = (1 << 31) - 1
+
+
+# Near-duplicate index over post texts, shared by the crawler (translation) and the NLP script (inference)
+#
+# Every text is normalized (Unicode form, case, punctuation, whitespace) and cut into word 3-grams. A MinHash
+# signature of num_perm values estimates the Jaccard similarity of two texts' 3-grams, and LSH with bands of
+# num_perm // bands values finds the candidates without comparing every pair.
+#
+# A text whose estimated similarity to an indexed representative reaches threshold joins its cluster,
+# otherwise it becomes the representative of a new one. Only representatives are indexed, so clusters keep
+# their centre. The texts table (key, representative, text) maps every text to its cluster and can be read
+# by the analytics side; keys are 16 hex digits of the SHA-256 of the normalized text.
+class DedupIndex:
+    def __init__(self, file_name='dedup_index.sqlite', threshold=0.9, num_perm=128, bands=32, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm has to be a multiple of bands")
+        self.file_name = file_name
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        random_state = np.random.RandomState(seed)
+        self.a = random_state.randint(1, PRIME, num_perm, dtype=np.int64)
+        self.b = random_state.randint(0, PRIME, num_perm, dtype=np.int64)
+        self.lock = threading.Lock()
+        # The crawler translates in worker threads and both scripts share the file
+        self.conn = sqlite3.connect(file_name, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS texts (key TEXT PRIMARY KEY, representative TEXT NOT NULL, '
+                          'text TEXT NOT NULL, signature BLOB)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS buckets (bucket TEXT NOT NULL, key TEXT NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS buckets_bucket ON buckets (bucket)')
+        self.conn.commit()
+        self.check_settings({'num_perm': num_perm, 'bands': bands, 'seed': seed})
+
+    # Signatures of different settings cannot be compared, an index keeps the settings it was built with
+    def check_settings(self, settings):
+        with self.conn:
+            for name, value in settings.items():
+                self.conn.execute('INSERT OR IGNORE INTO settings (name, value) VALUES (?, ?)', (name, str(value)))
+        stored = dict(self.conn.execute('SELECT name, value FROM settings').fetchall())
+        for name, value in settings.items():
+            if stored[name] != str(value):
+                raise ValueError(f"{self.file_name} was built with {name}={stored[name]}, not {value}")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    @staticmethod
+    def normalize(text):
+        text = unicodedata.normalize('NFKC', text or '').lower()
+        return ' '.join(re.findall(r'\w+', text))
+
+    @staticmethod
+    def key(normalized):
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16]
+
+    def signature(self, normalized):
+        words = normalized.split()
+        if len(words) < 3:
+            shingles = {normalized}
+        else:
+            shingles = {' '.join(words[i:i + 3]) for i in range(len(words) - 2)}
+        hashes = np.array([zlib.crc32(shingle.encode('utf-8')) & PRIME for shingle in shingles], dtype=np.int64)
+        return ((np.outer(hashes, self.a) + self.b) % PRIME).min(axis=0).astype(np.int32)
+
+    def buckets(self, signature):
+        return [f'{band}:' + hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+                                              digest_size=8).hexdigest()
+                for band in range(self.bands)]
+
+    # Indexed representative most similar to the signature, as (key, text), or None below the threshold
+    def closest_representative(self, signature):
+        buckets = self.buckets(signature)
+        placeholders = ','.join('?' * len(buckets))
+        rows = self.conn.execute(
+            f'SELECT key, text, signature FROM texts WHERE key IN '
+            f'(SELECT key FROM buckets WHERE bucket IN ({placeholders}))', buckets
+        ).fetchall()
+        best = None
+        for key, text, other in rows:
+            similarity = float(np.mean(signature == np.frombuffer(other, dtype=np.int32)))
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                best = (similarity, key, text)
+        return best[1:] if best else None
+
+    # Cluster of every text as (key, representative key, representative text), texts not seen before are added
+    def assign(self, texts):
+        results = []
+        assigned = {}
+        with self.lock, self.conn:
+            # Holds the write lock from the first lookup, so two processes never add the same text
+            self.conn.execute('BEGIN IMMEDIATE')
+            for text in texts:
+                normalized = self.normalize(text)
+                if not normalized:
+                    # Nothing but punctuation or emoji: only the exact same text is the same
+                    results.append((self.key(text or ''),) * 2 + (text,))
+                    continue
+                key = self.key(normalized)
+                if key not in assigned:
+                    row = self.conn.execute(
+                        'SELECT representative.key, representative.text FROM texts member '
+                        'JOIN texts representative ON representative.key = member.representative WHERE member.key = ?',
+                        (key,)
+                    ).fetchone()
+                    if row is None:
+                        row = self.add(key, text, normalized)
+                    assigned[key] = (key,) + tuple(row)
+                results.append(assigned[key])
+        return results
+
+    def add(self, key, text, normalized):
+        signature = self.signature(normalized)
+        closest = self.closest_representative(signature)
+        if closest is not None:
+            self.conn.execute('INSERT INTO texts (key, representative, text) VALUES (?, ?, ?)', (key, closest[0], text))
+            return closest
+        self.conn.execute('INSERT INTO texts (key, representative, text, signature) VALUES (?, ?, ?, ?)',
+                          (key, key, text, signature.tobytes()))
+        self.conn.executemany('INSERT INTO buckets (bucket, key) VALUES (?, ?)',
+                              [(bucket, key) for bucket in self.buckets(signature)])
+        return key, text
+
+    # Texts given to compute are one per key, i.e. per normalized text; every text gets the result of its key.
+    # Near-duplicates still join their clusters, but are computed on their own: a few different words can
+    # change what a text says, so they never get the result of another text.
+    def fan_out(self, texts, compute):
+        keys = [key for key, _, _ in self.assign(texts)]
+        first_texts = {}
+        for key, text in zip(keys, texts):
+            first_texts.setdefault(key, text)
+        results = dict(zip(first_texts, compute(list(first_texts.values()))))
+        return [results[key] for key in keys]
+
+    def stats(self):
+        texts, representatives = self.conn.execute(
+            'SELECT COUNT(*), SUM(key = representative) FROM texts').fetchone()
+        return {'texts': texts, 'clusters': representatives or 0,
+                'duplicate_share': round(1 - (representatives or 0) / texts, 4) if texts else 0.0}
+
+
+if __name__ == '__main__':
+    # python Text_Dedup.py [index file] prints the size of the index and its share of near-duplicates
+    index = DedupIndex(sys.argv[1] if len(sys.argv) > 1 else 'dedup_index.sqlite')
+    print(index.stats())
+    index.close()
@@ -0,0 +1,240 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Google Translate takes at most 5000 characters per request
+MAX_REQUEST_CHARS = 5000
+# Marker between the texts joined into one request, kept as it is by the translation
+SEPARATOR = '\n|||\n'
+SEPARATOR_PATTERN = re.compile(r'\s*\|\|\|\s*')
+
+
+# Splits a text longer than max_chars at whitespace into pieces of at most max_chars
+def split_text(text, max_chars=MAX_REQUEST_CHARS):
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(' ', 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip()
+    pieces.append(text)
+    return pieces
+
+
+# Backend that sends batches to Google Translate through deep-translator
+#
+# deep-translator's own translate_batch sends one request per text, so the texts are joined with SEPARATOR
+# into requests of up to MAX_REQUEST_CHARS and split again afterwards. A request that fails or does not
+# come back with one part per text is retried text by text; a text that still fails gives None.
+class GoogleBackend:
+    name = 'google'
+
+    def __init__(self, source='auto', target='en'):
+        self.source = source
+        self.target = target
+        # GoogleTranslator keeps per-request state on the instance, so every thread gets its own
+        self.local = threading.local()
+
+    def translator(self):
+        if not hasattr(self.local, 'translator'):
+            from deep_translator import GoogleTranslator
+            self.local.translator = GoogleTranslator(source=self.source, target=self.target)
+        return self.local.translator
+
+    def translate_batch(self, texts):
+        results = [None] * len(texts)
+        for indices in self.requests(texts):
+            if len(indices) > 1:
+                parts = self.translate_joined([texts[i] for i in indices])
+                if parts is not None:
+                    for i, part in zip(indices, parts):
+                        results[i] = part
+                    continue
+            for i in indices:
+                results[i] = self.translate_text(texts[i])
+        return results
+
+    # Groups the indices of the texts into requests that stay under MAX_REQUEST_CHARS
+    @staticmethod
+    def requests(texts):
+        request, size = [], 0
+        for i, text in enumerate(texts):
+            length = len(text) + len(SEPARATOR)
+            if request and size + length > MAX_REQUEST_CHARS:
+                yield request
+                request, size = [], 0
+            request.append(i)
+            size += length
+        if request:
+            yield request
+
+    def translate_joined(self, texts):
+        try:
+            parts = SEPARATOR_PATTERN.split(self.translator().translate(SEPARATOR.join(texts)).strip())
+        except Exception as e:
+            logger.warning("batch translation failed texts=%d error=%r, translating one by one", len(texts), e)
+            return None
+        if len(parts) != len(texts):
+            logger.warning("batch translation returned %d parts for %d texts, translating one by one",
+                           len(parts), len(texts))
+            return None
+        return parts
+
+    # Texts above MAX_REQUEST_CHARS are translated in pieces
+    def translate_text(self, text):
+        try:
+            return ' '.join(self.translator().translate(piece) for piece in split_text(text))
+        except Exception as e:
+            logger.error("translation failed chars=%d error=%r", len(text), e)
+            return None
+
+
+# Offline backend for test runs: returns the text unchanged (or prefixed) after an optional delay
+class StubBackend:
+    name = 'stub'
+
+    def __init__(self, target='en', prefix='', latency=0.0):
+        self.target = target
+        self.prefix = prefix
+        self.latency = latency
+
+    def translate_batch(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.prefix + text for text in texts]
+
+
+# Persistent translation cache in SQLite keyed by a hash of the target language and the source text
+class TranslationCache:
+    def __init__(self, file_name='translation_cache.sqlite', max_entries=200000):
+        self.file_name = file_name
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(file_name, check_same_thread=False)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS translations ('
+            'key TEXT PRIMARY KEY, translation TEXT NOT NULL, last_used REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)')
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text, target):
+        return hashlib.sha256(f'{target}\0{text}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT key, translation FROM translations WHERE key IN ({placeholders})', chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self.conn.executemany('UPDATE translations SET last_used = ? WHERE key = ?',
+                                      [(now, key) for key in found])
+                self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO translations (key, translation, last_used) VALUES (?, ?, ?)',
+                [(key, translation, now) for key, translation in items.items()]
+            )
+            self.evict()
+            self.conn.commit()
+
+    # Drop the least recently used tenth once the cache grows past max_entries
+    def evict(self):
+        count = self.conn.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - self.max_entries + self.max_entries // 10
+        self.conn.execute(
+            'DELETE FROM translations WHERE key IN '
+            '(SELECT key FROM translations ORDER BY last_used LIMIT ?)', (excess,)
+        )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# Translation layer: cache lookups first, one backend call for everything that is left. When that call
+# fails as a whole, every text is sent again on its own, so one bad text keeps only itself untranslated.
+class Translator:
+    def __init__(self, backend, cache=None, metrics=None):
+        self.backend = backend
+        self.cache = cache
+        # Optional CrawlMetrics (Crawl_Metrics.py) that gets the time and cache hits of every call
+        self.metrics = metrics
+
+    def translate(self, text):
+        return self.translate_many([text])[0]
+
+    def translate_many(self, texts):
+        start = time.perf_counter()
+        target = getattr(self.backend, 'target', 'en')
+        translations = {}
+        pending = {}
+        for text in texts:
+            # Nothing to translate, same as deep-translator returning empty input unchanged
+            if not text or not text.strip():
+                translations[text] = text
+            else:
+                pending[text] = None
+        pending = list(pending)
+        requested = len(pending)
+
+        if pending and self.cache is not None:
+            keys = {text: TranslationCache.key(text, target) for text in pending}
+            cached = self.cache.get_many(list(keys.values()))
+            for text, key in keys.items():
+                if key in cached:
+                    translations[text] = cached[key]
+            pending = [text for text in pending if text not in translations]
+
+        if pending:
+            try:
+                results = self.backend.translate_batch(pending)
+            except Exception as e:
+                logger.warning("translation batch failed texts=%d error=%r, translating one by one",
+                               len(pending), e)
+                results = [self.translate_single(text) for text in pending]
+
+            new_entries = {}
+            for text, result in zip(pending, results):
+                if result is None:
+                    # Keep the original text and try again on a later run
+                    translations[text] = text
+                else:
+                    translations[text] = result
+                    new_entries[TranslationCache.key(text, target)] = result
+            if new_entries and self.cache is not None:
+                self.cache.put_many(new_entries)
+
+        if self.metrics is not None:
+            self.metrics.observe_translation(time.perf_counter() - start, requested, requested - len(pending))
+        return [translations[text] for text in texts]
+
+    def translate_single(self, text):
+        try:
+            return self.backend.translate_batch([text])[0]
+        except Exception as e:
+            logger.error("translation failed chars=%d error=%r", len(text), e)
+            return None
@@ -1,56 +1,72 @@
-import requests
-from bs4 import BeautifulSoup
-import re
+import asyncio
+import logging
 import time
-import pandas as pd
-from deep_translator import GoogleTranslator
-import schedule
-import json
-import os
-
-# List of known models
-models_list = [
-    'iMOW 5 EVO', 'iMOW 6 EVO', 'iMOW 7 EVO',
-    'iMOW 5', 'iMOW 6', 'iMOW 7', 'iMOW 4',
-    'iMOW 422', 'iMOW 522', 'iMOW 632'
+import math
+from Crawl_Engine import AsyncFetcher, PageCache
+from Crawl_Metrics import CrawlMetrics
+from Crawl_State import CrawlState
+from Model_Matcher import ModelMatcher, load_catalogue
+from Post_Store import PostStore
+from Site_Adapters import make_adapter
+from Text_Dedup import DedupIndex
+from Translation import GoogleBackend, StubBackend, TranslationCache, Translator
+
+logger = logging.getLogger(__name__)
+
+# Sites to crawl, each through the adapter of its forum software (Site_Adapters.py)
+sites = [
+    {'engine': 'xenforo', 'forum_url': 'https://www.roboter-forum.com/forums/imow-5-6-7-evo.255/'},
 ]
 
-# Regular expressions for model detection
-model_patterns = {
-    'iMOW 5 EVO': r'\bimow\s*5\s*evo\b',
-    'iMOW 6 EVO': r'\bimow\s*6\s*evo\b',
-    'iMOW 7 EVO': r'\bimow\s*7\s*evo\b|\bimow7evo\b|\bmower\s*7\s*evo\b|\bevo\s*7\b',
-    'iMOW 4': r'\bimow\s*4\b(?!\s*evo)',
-    'iMOW 5': r'\bimow\s*5\b(?!\s*evo)',
-    'iMOW 6': r'\bimow\s*6\b(?!\s*evo)',
-    'iMOW 7': r'\bimow\s*7\b(?!\s*evo)',
-    'iMOW 422': r'\bimow\s*422\b',
-    'iMOW 522': r'\bimow\s*522\b',
-    'iMOW 632': r'\bimow\s*632\b',
-}
-
-combined_patterns = [
-    r'\bimow\s*5\s*(,|/| and |&|\s)*6\s*(,|/| and |&|\s)*7\b',
-    r'\bimow\s*5\s*-\s*7\b',
-    r'\bimow\s*5-7\b',
-]
+# Crawl engine settings
+max_connections_per_host = 8  # Connections to one host, the shared pool grows with the number of sites
+requests_per_second = 0.5  # Politeness budget per host
+request_burst = 2  # Requests a host may receive back to back before the budget applies
+host_rates = {}  # Budget of single hosts: {'www.example.com': (requests_per_second, request_burst)}
+max_retries = 4  # Retries with backoff on 429/5xx and connection errors
+max_concurrent_threads = 4  # Threads of one site processed at the same time
+max_thread_attempts = 5  # Runs a thread that fails or stops early is tried in before it is dropped
+listing_prefetch = 2  # Listing pages downloaded ahead of the one being processed
+page_cache_entries = 128  # Pages kept in memory for reuse within a run
+page_cache_bytes = 32 * 1024 * 1024
+
+# Translation settings
+translation_backend = 'google'  # 'stub' keeps the text as it is, for offline runs and tests
+translation_cache_file = 'translation_cache.sqlite'
+translation_cache_entries = 200000
+dedup_index_file = 'dedup_index.sqlite'  # Texts that only differ in case and punctuation are translated once, shared with NLP.py; None turns it off
+dedup_threshold = 0.9  # Estimated share of common word 3-grams that makes two texts near-duplicates
+
+# Incremental crawl settings
+crawl_state_file = 'crawl_state.json'  # Per-thread watermarks, replaces crawled_urls.json
+
+# Output settings
+post_store_file = 'crawl_store.sqlite'  # Append-only store of all crawled posts and model counts
+excel_file = 'Web Crawled.xlsx'  # Exported on demand with Post_Store.py, imported once into the store
+model_excel_file = 'modelCrawled.xlsx'
+export_after_run = False  # Rewrite the Excel files after every run (cost grows with the history)
+flush_batch_size = 200  # Posts written to the store (and state checkpointed) at a time
+flush_interval = 5  # Seconds at most between writes of finished threads, so the NLP consumer sees posts quickly
+
+# Scheduling settings
+default_poll_interval = 2 * 60 * 60  # Interval of the first run, in seconds
+min_poll_interval = 10 * 60  # While the forum is busy
+max_poll_interval = 6 * 60 * 60  # While the forum is quiet
+burst_posts = 5  # New posts in one run that count as a burst
+
+# Monitoring settings
+log_level = 'INFO'  # 'DEBUG' also logs every request and every scraped post
+metrics_file = 'crawl_metrics.prom'  # Written after every run, a .json name writes a JSON snapshot, None for none
+
+# Model aliases live in model_catalogue.json, add new models there
+model_matcher = ModelMatcher(load_catalogue())
+
+# List of known models
+models_list = model_matcher.models
 
+# Function to find the models mentioned in a text, in a single scan
 def extract_models(text):
-    found_models = set()
-    text = text.lower()
-    
-    # Check for individual models
-    for model, pattern in model_patterns.items():
-        if re.search(pattern, text):
-            found_models.add(model)
-    
-    # Check for combined models
-    for pattern in combined_patterns:
-        if re.search(pattern, text):
-            found_models.update(['iMOW 4','iMOW 5', 'iMOW 6', 'iMOW 7', 'iMOW 5 EVO', 'iMOW 6 EVO', 'iMOW 7 EVO'])
-            break
-    
-    return found_models
+    return model_matcher.extract(text)
 
 def categorize_model(title, first_post_content):
     # Check the title first
@@ -59,7 +75,7 @@ def categorize_model(title, first_post_content):
         if {'iMOW 4','iMOW 5', 'iMOW 6', 'iMOW 7', 'iMOW 5 EVO', 'iMOW 6 EVO', 'iMOW 7 EVO'}.issubset(title_models):
             return 'All'
         if 'evo' in title.lower() and any(model.endswith('EVO') for model in title_models):
-            evo_model = next(model for model in title_models if model.endswith('EVO') or model.beginswith('EVO'))
+            evo_model = next(model for model in sorted(title_models) if model.endswith('EVO'))
             return evo_model
         return ', '.join(sorted(title_models))
 
@@ -72,225 +88,414 @@ def categorize_model(title, first_post_content):
 
     return 'General'
 
-# Function to scrape forum data
-def scrape_forum(url, crawled_urls):
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    data = []
-    model_counts = {}
-
-    while url:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            threads = soup.find_all('div', class_='structItem-title')
-            for thread in threads:
-                thread_link = thread.find('a', href=True)
-                if thread_link:
-                    thread_url = 'https://www.roboter-forum.com' + thread_link['href']
-                    thread_title = thread_link.text.strip()
-                    if thread_url in crawled_urls:
+# Function to call a parse or extract step and add its time to the metrics
+def timed(metrics, stage, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    if metrics is not None:
+        metrics.observe_stage(stage, time.perf_counter() - start)
+    return result
+
+# Function to fetch the pages after start_page of a listing or thread concurrently, in page order
+async def fetch_remaining_pages(fetcher, adapter, root, url, start_page=1):
+    page_urls = adapter.page_urls(root, url, start_page)
+    responses = await asyncio.gather(*(fetcher.fetch(page_url) for page_url in page_urls))
+    return list(zip(page_urls, responses))
+
+# Function to take over a thread from the old crawled_urls.json: the listing reply count becomes its watermark
+def adopt_thread(crawl_state, thread, adapter):
+    last_post = thread['replies'] + 1
+    crawl_state.update(thread['url'], replies=thread['replies'], last_post=last_post,
+                       last_page=math.ceil(last_post / adapter.posts_per_page))
+
+# Function to decide whether a listed thread needs to be fetched
+def needs_crawl(crawl_state, thread, adapter):
+    state = crawl_state.get(thread['url'])
+    if state is None:
+        return True
+    if 'replies' not in state:
+        if thread['replies'] is not None:
+            adopt_thread(crawl_state, thread, adapter)
+        return False
+    return thread['replies'] is None or thread['replies'] != state['replies']
+
+# Function to scrape one site as a stream: yields (thread, state, model, records, watermark) as each thread completes
+# Only new threads and threads with new replies are fetched. The site's frontier in crawl_state lists the
+# listing pages and threads that are not finished yet, so an interrupted run resumes from it.
+async def crawl_forum(adapter, crawl_state, fetcher):
+    url = adapter.forum_url
+    frontier = crawl_state.frontier(url)
+    thread_queue = asyncio.Queue(maxsize=max_concurrent_threads * 2)
+    results = asyncio.Queue()
+
+    async def produce():
+        try:
+            seen_urls = set(frontier['threads'])
+            for thread in list(frontier['threads'].values()):
+                await thread_queue.put(thread)
+            if not frontier['listing'] and not frontier['threads']:
+                frontier['listing'] = [url]
+
+            # Threads that failed on an earlier run are queued again: the listing stops at the newest activity
+            # of that run, which already covers them
+            retry_threads = [thread for thread in frontier['retry'].values() if thread['url'] not in seen_urls]
+            for thread in retry_threads:
+                seen_urls.add(thread['url'])
+                frontier['threads'][thread['url']] = thread
+            frontier['retry'].clear()
+            for thread in retry_threads:
+                await thread_queue.put(thread)
+
+            # Listings are sorted by last activity: once a page ends with a thread that has not changed since
+            # the newest activity of the last run, every later page is older and is not read
+            since = frontier['newest_activity']
+            newest_activity = since
+            prefetches = {}
+            while frontier['listing']:
+                page_url = frontier['listing'][0]
+                prefetch = prefetches.pop(page_url, None)
+                status, text = await prefetch if prefetch else await fetcher.fetch(page_url)
+                if status != 200:
+                    logger.error("listing page failed url=%s status=%s", page_url, status)
+                    frontier['listing'] = []
+                    break
+
+                root = timed(fetcher.metrics, 'parse', adapter.parse, text)
+                if page_url == url:
+                    frontier['listing'] = [url] + adapter.page_urls(root, url)
+                threads = timed(fetcher.metrics, 'extract', adapter.listing_threads, root)
+
+                # All threads of the page join the frontier before the page leaves it, with no await in
+                # between, so a batch flushed while they wait for the queue saves them as unfinished
+                new_threads = []
+                for thread in threads:
+                    if thread['last_activity'] is not None:
+                        newest_activity = max(newest_activity or 0, thread['last_activity'])
+                    if thread['url'] in seen_urls:
                         continue
-                    print(f"Processing thread: {thread_title} - {thread_url}")
-                    first_post_content = get_first_post_content(thread_url, headers)
-                    model = categorize_model(thread_title, first_post_content)
-                    model_counts[model] = model_counts.get(model, 0) + 1
-
-                    # Request each thread page
-                    scrape_thread(thread_url, thread_title, model, data, headers)
-                    crawled_urls.add(thread_url)
-                    time.sleep(40)
-
-            # Find the "Next" button for pagination
-            next_button = soup.find('a', class_='pageNav-jump--next')
-            url = 'https://www.roboter-forum.com' + next_button['href'] if next_button else None
-        else:
-            print(f"Failed to retrieve forum page with status code: {response.status_code}")
-            return data, model_counts
-    
-    return data, model_counts
-
-# Function to scrape each thread
-def scrape_thread(thread_url, thread_title, model, data, headers):
-    first_post_date = None
-    while thread_url:
-        thread_response = requests.get(thread_url, headers=headers)
-        if thread_response.status_code == 200:
-            thread_soup = BeautifulSoup(thread_response.text, 'html.parser')
-            posts = thread_soup.find_all('article', class_='message')
-            for post in posts:
-                post_sequence = None
-                post_sequence_element = post.find('ul', class_='message-attribution-opposite')
-                if post_sequence_element:
-                    post_sequence = post_sequence_element.find_all('li')[1].text.strip()
-
-                post_author = post['data-author'] if 'data-author' in post.attrs else ''
-                post_date = post.find('time')['datetime'] if post.find('time') else ''
-                if not first_post_date:
-                    first_post_date = post_date
-
-                reactions_bar = post.find('div', class_='reactionsBar')
-                if reactions_bar:
-                    reactions_link = reactions_bar.find('a', class_='reactionsBar-link')
-                    if reactions_link:
-                        post_reactions_text = reactions_link.get_text(strip=True)
-                        post_reactions_count = len(re.split(r',|und', post_reactions_text))
-                    else:
-                        post_reactions_count = 0
-                else:
-                    post_reactions_count = 0
-
-                responses_count = len(post.find_all('blockquote')) if post.find_all('blockquote') else 0
-
-                # Extract quotes and references
-                response_to = []
-                for quote in post.find_all('blockquote'):
-                    response_to.append(quote['data-quote'] if 'data-quote' in quote.attrs else '')
-                
-                references = [a['href'] for a in post.find_all('a', href=True) if 'http' in a['href']]
-                references_text = ', '.join(references)
-
-                # Clean the main content
-                post_content = post.find('div', class_='bbWrapper')
-                quote_texts = extract_and_clean_quotes(post_content)
-                bbCodeBlock_texts = extract_and_clean_bbCodeBlocks(post_content)
-
-                post_content_cleaned = clean_main_content(post_content)
-
-                if post_content_cleaned.strip():
-                    # Translate post content
-                    translated_post_content = translate_text(post_content_cleaned)
-                    translated_thread_title = translate_text(thread_title)
-                    translated_quote_texts = [translate_text(text) for text in quote_texts]
-                    translated_bbCodeBlock_texts = [translate_text(text) for text in bbCodeBlock_texts]
-                    
-                    data.append({
-                        'thread_title': translated_thread_title,
-                        'post_content': translated_post_content,
-                        'post_author': post_author,
-                        'post_date': post_date,
-                        'post_sequence': post_sequence,
-                        'post_reactions': post_reactions_count,
-                        'first_post_date': first_post_date,
-                        'response_to': ', '.join(response_to),
-                        'references': references_text,
-                        'responses_count': responses_count,
-                        'thread_url': thread_url,
-                        'platform': 'roboter-forum.com',
-                        'model': model,
-                        'quote_text': ' | '.join(translated_quote_texts),
-                        'bbCodeBlock_text': ' | '.join(translated_bbCodeBlock_texts)
-                    })
-                    print(f"Scraped data: {data[-1]}")
-            
-            next_button = thread_soup.find('a', class_='pageNav-jump--next')
-            thread_url = 'https://www.roboter-forum.com' + next_button['href'] if next_button else None
-        else:
-            print(f"Failed to retrieve thread page with status code: {thread_response.status_code}")
-            break
+                    seen_urls.add(thread['url'])
+                    if needs_crawl(crawl_state, thread, adapter):
+                        frontier['threads'][thread['url']] = thread
+                        new_threads.append(thread)
+                frontier['listing'].pop(0)
+                if since is not None and threads and threads[-1]['last_activity'] is not None \
+                        and threads[-1]['last_activity'] <= since:
+                    frontier['listing'] = []
+
+                # Keep the next listing pages downloading while the threads of this one are queued
+                for next_url in frontier['listing'][:listing_prefetch]:
+                    if next_url not in prefetches:
+                        prefetches[next_url] = asyncio.ensure_future(fetcher.fetch(next_url))
+
+                for thread in new_threads:
+                    await thread_queue.put(thread)
+            else:
+                frontier['newest_activity'] = newest_activity
 
-def get_first_post_content(thread_url, headers):
-    response = requests.get(thread_url, headers=headers)
-    if response.status_code == 200:
-        thread_soup = BeautifulSoup(response.text, 'html.parser')
-        first_post = thread_soup.find('article', class_='message')
-        if first_post:
-            content = first_post.find('div', class_='bbWrapper')
-            return content.get_text(' ', strip=True) if content else ''
-    return ''
-
-def clean_main_content(bbWrapper):
-    for quote in bbWrapper.find_all('blockquote'):
-        quote.decompose()
-    for link in bbWrapper.find_all('a', href=True):
-        link.decompose()
-    for bb_code in bbWrapper.find_all('div', class_='bbCodeBlock'):
-        bb_code.decompose()
-    return bbWrapper.get_text(' ', strip=True)
-
-def extract_and_clean_quotes(bbWrapper):
-    quote_texts = []
-    for quote in bbWrapper.find_all('blockquote'):
-        quote_texts.append(quote.get_text(' ', strip=True))
-        quote.decompose()
-    return quote_texts
-
-def extract_and_clean_bbCodeBlocks(bbWrapper):
-    bbCodeBlock_texts = []
-    for bb_code in bbWrapper.find_all('div', class_='bbCodeBlock'):
-        bbCodeBlock_texts.append(bb_code.get_text(' ', strip=True))
-        bb_code.decompose()
-    return bbCodeBlock_texts
+            for prefetch in prefetches.values():
+                prefetch.cancel()
+        finally:
+            for _ in range(max_concurrent_threads):
+                await thread_queue.put(None)
 
-def translate_text(text):
+    async def work():
+        try:
+            while True:
+                thread = await thread_queue.get()
+                if thread is None:
+                    break
+                state = crawl_state.get(thread['url'])
+                logger.info("processing thread url=%s title=%r", thread['url'], thread['title'])
+                model, records, watermark = await scrape_thread(fetcher, adapter, thread['url'], thread['title'], state)
+                await results.put((thread, state, model, records, watermark))
+        finally:
+            await results.put(None)
+
+    producer = asyncio.ensure_future(produce())
+    workers = [asyncio.ensure_future(work()) for _ in range(max_concurrent_threads)]
+    try:
+        finished_workers = 0
+        while finished_workers < len(workers):
+            result = await results.get()
+            if result is None:
+                finished_workers += 1
+                continue
+            yield result
+        # Re-raise anything that stopped the producer or a worker
+        await asyncio.gather(producer, *workers)
+    finally:
+        for task in [producer, *workers]:
+            task.cancel()
+
+# Function to crawl all sites at the same time: yields (adapter, thread, state, model, records, watermark)
+# Every site runs its own crawl_forum, and the fetcher keeps a separate politeness budget for each host, so
+# a slow or strict site does not hold the others back.
+async def crawl_sites(adapters, crawl_state, fetcher):
+    results = asyncio.Queue()
+
+    async def crawl(adapter):
+        try:
+            async for result in crawl_forum(adapter, crawl_state, fetcher):
+                await results.put((adapter, *result))
+        finally:
+            await results.put(None)
+
+    crawls = [asyncio.ensure_future(crawl(adapter)) for adapter in adapters]
     try:
-        return GoogleTranslator(source='auto', target='en').translate(text)
-    except Exception as e:
-        print(f"Translation error: {e}")
-        return text
-
-def save_to_excel(data, model_counts, file_name='Web Crawled.xlsx', model_file_name='modelCrawled.xlsx'):
-    data_saved = False
-    model_data_saved = False
+        finished_crawls = 0
+        while finished_crawls < len(crawls):
+            result = await results.get()
+            if result is None:
+                finished_crawls += 1
+                continue
+            yield result
+        # Re-raise anything that stopped the crawl of a site
+        await asyncio.gather(*crawls)
+    finally:
+        for task in crawls:
+            task.cancel()
+
+# Function to write a batch to the store and checkpoint the crawl state right after it
+def flush_batch(batch, model_counts, finished_threads, crawl_state, store):
+    rows_added = store.add_posts(batch)
+    store.add_model_counts(model_counts)
+    for adapter, thread, watermark in finished_threads:
+        frontier = crawl_state.frontier(adapter.forum_url)
+        frontier['threads'].pop(thread['url'], None)
+        complete = watermark is not None and watermark.pop('complete')
+        if watermark is not None:
+            # A thread that stopped early keeps no reply count, so a listing that shows it again picks it up
+            replies = thread['replies'] if complete else None
+            crawl_state.update(thread['url'], replies=replies, last_activity=thread['last_activity'], **watermark)
+        if complete:
+            continue
+        # Threads that could not be fetched at all or stopped early go to the retry list of the next run
+        attempts = thread.get('attempts', 0) + 1
+        if attempts < max_thread_attempts:
+            frontier['retry'][thread['url']] = dict(thread, attempts=attempts)
+        else:
+            logger.warning("thread dropped after %d attempts url=%s", attempts, thread['url'])
+    crawl_state.save()
+    if batch:
+        logger.info("flushed rows=%d posts=%d store=%s", rows_added, len(batch), store.file_name)
+    batch.clear()
+    model_counts.clear()
+    finished_threads.clear()
+    return rows_added
+
+# Function to crawl the sites and flush the posts to the store in batches as threads complete
+async def stream_sites(adapters, crawl_state, store, fetcher):
     rows_added = 0
+    batch = []
+    model_counts = {}
+    finished_threads = []
+    last_flush = time.monotonic()
+    async for adapter, thread, state, model, records, watermark in crawl_sites(adapters, crawl_state, fetcher):
+        if watermark is not None:
+            if state is None:
+                model_counts[model] = model_counts.get(model, 0) + 1
+            batch.extend(records)
+            if fetcher.metrics is not None:
+                fetcher.metrics.observe_posts(len(records))
+        finished_threads.append((adapter, thread, watermark))
+        if len(batch) >= flush_batch_size or (batch and time.monotonic() - last_flush >= flush_interval):
+            rows_added += flush_batch(batch, model_counts, finished_threads, crawl_state, store)
+            last_flush = time.monotonic()
+    rows_added += flush_batch(batch, model_counts, finished_threads, crawl_state, store)
+    return rows_added
+
+# Function to run the async crawl from synchronous code, returns the number of new rows in the store
+# Requests, parsing and translation report to metrics when one is given
+def scrape_sites(adapters, crawl_state, store, metrics=None):
+    page_cache = PageCache(max_entries=page_cache_entries, max_bytes=page_cache_bytes)
+    get_translator().metrics = metrics
+
+    async def run():
+        hosts = {adapter.host for adapter in adapters}
+        async with AsyncFetcher(max_connections=max_connections_per_host * len(hosts),
+                                connections_per_host=max_connections_per_host, rate=requests_per_second,
+                                burst=request_burst, host_rates=host_rates, max_retries=max_retries,
+                                cache=page_cache, metrics=metrics) as fetcher:
+            return await stream_sites(adapters, crawl_state, store, fetcher)
+    try:
+        return asyncio.run(run())
+    finally:
+        get_translator().metrics = None
+        if metrics is not None:
+            metrics.finish(page_cache)
+
+# Function to translate the posts of a thread page into output records, in one backend call per page
+def build_records(posts_data, translated_thread_title, thread_url, platform, model, translator, dedup_index=None):
+    texts = []
+    for post in posts_data:
+        texts.append(post['post_content'])
+        texts.extend(post['quote_texts'])
+        texts.extend(post['bbCodeBlock_texts'])
+    # Posts, quotes of them and repeated boilerplate are translated once per normalized text; near-duplicates
+    # are only recorded in the index for NLP.py and translated on their own
+    if dedup_index is not None:
+        translations = dict(zip(texts, dedup_index.fan_out(texts, translator.translate_many)))
+    else:
+        translations = dict(zip(texts, translator.translate_many(texts)))
+
+    records = []
+    for post in posts_data:
+        translated_quote_texts = [translations[text] for text in post['quote_texts']]
+        translated_bbCodeBlock_texts = [translations[text] for text in post['bbCodeBlock_texts']]
+
+        records.append({
+            'thread_title': translated_thread_title,
+            'post_content': translations[post['post_content']],
+            'post_author': post['post_author'],
+            'post_date': post['post_date'],
+            'post_sequence': post['post_sequence'],
+            'post_reactions': post['post_reactions'],
+            'first_post_date': post['first_post_date'],
+            'response_to': post['response_to'],
+            'references': post['references'],
+            'responses_count': post['responses_count'],
+            'thread_url': thread_url,
+            'platform': platform,
+            'model': model,
+            'quote_text': ' | '.join(translated_quote_texts),
+            'bbCodeBlock_text': ' | '.join(translated_bbCodeBlock_texts)
+        })
+        logger.debug("scraped post url=%s sequence=%s author=%r", thread_url, post['post_sequence'], post['post_author'])
+    return records
+
+# Function to scrape each thread from its last seen page, page 1 is fetched and parsed once for both the model and the posts
+async def scrape_thread(fetcher, adapter, thread_url, thread_title, state=None):
+    state = state or {}
+    records = []
+    start_page = state.get('last_page') or 1
+    last_post = state.get('last_post') or 0
+
+    status, text = await fetcher.fetch(adapter.page_url(thread_url, start_page))
+    if status != 200:
+        logger.error("thread page failed url=%s status=%s", thread_url, status)
+        return state.get('model'), records, None
+    start_root = timed(fetcher.metrics, 'parse', adapter.parse, text)
+
+    model = state.get('model')
+    first_post_date = state.get('first_post_date')
+    if model is None:
+        first_root = start_root
+        if start_page > 1:
+            status, text = await fetcher.fetch(thread_url)
+            first_root = timed(fetcher.metrics, 'parse', adapter.parse, text if status == 200 else '')
+        model = categorize_model(thread_title, adapter.first_post_text(first_root))
+        if start_page > 1 and not first_post_date:
+            _, first_post_date = adapter.thread_posts(first_root, None)
+
+    pages = [(adapter.page_url(thread_url, start_page), start_root)]
+    complete = True
+    for page_url, (status, text) in await fetch_remaining_pages(fetcher, adapter, start_root, thread_url, start_page):
+        if status != 200:
+            logger.error("thread page failed url=%s status=%s", page_url, status)
+            complete = False
+            break
+        pages.append((page_url, timed(fetcher.metrics, 'parse', adapter.parse, text)))
+
+    # Translation is blocking, keep it off the event loop
+    translator = get_translator()
+    dedup_index = get_dedup_index()
+    translated_thread_title = None
+
+    # Pages are parsed in order so the first post date carries over like a sequential walk
+    last_page = start_page
+    for last_page, (page_url, page_root) in enumerate(pages, start_page):
+        posts_data, first_post_date = timed(fetcher.metrics, 'extract', adapter.thread_posts, page_root, first_post_date)
+
+        # Only posts past the watermark are new; posts without a "#N" label are always sent, the store skips
+        # the ones it already has by author and date
+        new_posts = []
+        for post in posts_data:
+            number = adapter.post_number(post['post_sequence'])
+            if number is None or number > last_post:
+                new_posts.append(post)
+                if number is not None:
+                    last_post = number
+        if not new_posts:
+            continue
+
+        if translated_thread_title is None:
+            translated_thread_title = await asyncio.to_thread(translator.translate, thread_title)
+        records.extend(await asyncio.to_thread(build_records, new_posts, translated_thread_title,
+                                               page_url, adapter.platform, model, translator, dedup_index))
+
+    watermark = {
+        'last_page': last_page,
+        'last_post': last_post,
+        'model': model,
+        'first_post_date': first_post_date,
+        'complete': complete
+    }
+    return model, records, watermark
+
+_translator = None
+
+def get_translator():
+    global _translator
+    if _translator is None:
+        if translation_backend == 'stub':
+            backend = StubBackend()
+        else:
+            backend = GoogleBackend(source='auto', target='en')
+        cache = TranslationCache(translation_cache_file, max_entries=translation_cache_entries)
+        _translator = Translator(backend, cache)
+    return _translator
 
-    while not data_saved:
-        try:
-            if os.path.exists(file_name):
-                existing_data = pd.read_excel(file_name)
-                df = pd.DataFrame(data)
-                rows_added = len(df)
-                df = pd.concat([existing_data, df], ignore_index=True)
-            else:
-                df = pd.DataFrame(data)
-                rows_added = len(df)
-            df.to_excel(file_name, index=False)
-            data_saved = True
-        except PermissionError:
-            print(f"Unable to save data to {file_name} because the file is open. Retrying in 20 seconds...")
-            time.sleep(20)
-
-    while not model_data_saved:
-        try:
-            if os.path.exists(model_file_name):
-                existing_model_counts = pd.read_excel(model_file_name, index_col=0).to_dict()
-                for key, value in existing_model_counts.items():
-                    if key in model_counts:
-                        model_counts[key] += value
-            pd.Series(model_counts).to_excel(model_file_name)
-            model_data_saved = True
-        except PermissionError:
-            print(f"Unable to save model data to {model_file_name} because the file is open. Retrying in 20 seconds...")
-            time.sleep(20)
-    
-    print(f"Added {rows_added} rows to {file_name}")
-
-def load_crawled_urls(file_name='crawled_urls.json'):
-    if os.path.exists(file_name):
-        with open(file_name, 'r') as f:
-            return set(json.load(f))
-    return set()
-
-def save_crawled_urls(crawled_urls, file_name='crawled_urls.json'):
-    with open(file_name, 'w') as f:
-        json.dump(list(crawled_urls), f)
+_dedup_index = None
 
-def main():
-    forum_url = 'https://www.roboter-forum.com/forums/imow-5-6-7-evo.255/'
-    crawled_urls = load_crawled_urls()
-    data, model_counts = scrape_forum(forum_url, crawled_urls)
+def get_dedup_index():
+    global _dedup_index
+    if _dedup_index is None and dedup_index_file:
+        _dedup_index = DedupIndex(dedup_index_file, threshold=dedup_threshold)
+    return _dedup_index
 
-    if not data:
-        print("No New Comments for now. Check in 2 hours")
-    else:
-        save_to_excel(data, model_counts)
-        save_crawled_urls(crawled_urls)
-        print("Data extraction complete. Check the generated Excel files.")
+def translate_text(text):
+    return get_translator().translate(text)
 
-# Schedule the script to run every 2 hours
-schedule.every(2).hours.do(main)
+# Function to pick the time until the next run from how many new posts this run found
+def next_poll_interval(interval, rows_added):
+    if rows_added >= burst_posts:
+        return min_poll_interval
+    if rows_added:
+        return max(min_poll_interval, interval // 2)
+    return min(max_poll_interval, interval * 2)
 
+def main():
+    adapters = [make_adapter(site) for site in sites]
+    crawl_state = CrawlState(crawl_state_file).load()
+    store = PostStore(post_store_file)
+    store.import_excel(excel_file, model_excel_file)
+    metrics = CrawlMetrics()
+    # Posts and watermarks are saved batch by batch while the crawl runs
+    rows_added = scrape_sites(adapters, crawl_state, store, metrics)
+
+    interval = next_poll_interval(crawl_state.run.get('poll_interval', default_poll_interval), rows_added)
+    crawl_state.run['poll_interval'] = interval
+    crawl_state.save()
+
+    snapshot = metrics.snapshot()
+    logger.info("run finished rows=%d posts=%d requests=%d seconds=%.1f posts_per_second=%.2f",
+                rows_added, snapshot['posts'], sum(host['requests'] for host in snapshot['hosts'].values()),
+                snapshot['duration_seconds'], snapshot['posts_per_second'])
+    if metrics_file:
+        metrics.write(metrics_file)
+
+    if not rows_added:
+        logger.info("No New Comments for now. Check in %d minutes", interval // 60)
+    else:
+        if export_after_run:
+            store.export_excel(excel_file, model_excel_file)
+        logger.info("Data extraction complete. Run Post_Store.py to export the Excel files. Next check in %d minutes",
+                    interval // 60)
+    store.close()
+    return interval
+
+# Run again after an interval that follows the forum activity: short while posts keep coming, long when it is quiet
 if __name__ == '__main__':
-    main()
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
     while True:
-        schedule.run_pending()
-        time.sleep(1)
+        time.sleep(main())
@@ -0,0 +1,120 @@
+import os
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Post_Extraction import extract_posts, parse_html
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+REPEAT = 20
+
+
+# The BeautifulSoup/html.parser extraction the crawler used before Post_Extraction, kept as the reference
+def legacy_extract_posts(text, first_post_date):
+    thread_soup = BeautifulSoup(text, 'html.parser')
+    posts_data = []
+    for post in thread_soup.find_all('article', class_='message'):
+        post_sequence = None
+        post_sequence_element = post.find('ul', class_='message-attribution-opposite')
+        if post_sequence_element:
+            post_sequence = post_sequence_element.find_all('li')[1].text.strip()
+
+        post_author = post['data-author'] if 'data-author' in post.attrs else ''
+        post_date = post.find('time')['datetime'] if post.find('time') else ''
+        if not first_post_date:
+            first_post_date = post_date
+
+        reactions_bar = post.find('div', class_='reactionsBar')
+        if reactions_bar:
+            reactions_link = reactions_bar.find('a', class_='reactionsBar-link')
+            if reactions_link:
+                post_reactions_text = reactions_link.get_text(strip=True)
+                post_reactions_count = len(re.split(r',|und', post_reactions_text))
+            else:
+                post_reactions_count = 0
+        else:
+            post_reactions_count = 0
+
+        responses_count = len(post.find_all('blockquote')) if post.find_all('blockquote') else 0
+
+        response_to = []
+        for quote in post.find_all('blockquote'):
+            response_to.append(quote['data-quote'] if 'data-quote' in quote.attrs else '')
+
+        references = [a['href'] for a in post.find_all('a', href=True) if 'http' in a['href']]
+        references_text = ', '.join(references)
+
+        post_content = post.find('div', class_='bbWrapper')
+        quote_texts = []
+        for quote in post_content.find_all('blockquote'):
+            quote_texts.append(quote.get_text(' ', strip=True))
+            quote.decompose()
+        bbCodeBlock_texts = []
+        for bb_code in post_content.find_all('div', class_='bbCodeBlock'):
+            bbCodeBlock_texts.append(bb_code.get_text(' ', strip=True))
+            bb_code.decompose()
+        for link in post_content.find_all('a', href=True):
+            link.decompose()
+        post_content_cleaned = post_content.get_text(' ', strip=True)
+
+        if post_content_cleaned.strip():
+            posts_data.append({
+                'post_content': post_content_cleaned,
+                'post_author': post_author,
+                'post_date': post_date,
+                'post_sequence': post_sequence,
+                'post_reactions': post_reactions_count,
+                'first_post_date': first_post_date,
+                'response_to': ', '.join(response_to),
+                'references': references_text,
+                'responses_count': responses_count,
+                'quote_texts': quote_texts,
+                'bbCodeBlock_texts': bbCodeBlock_texts
+            })
+    return posts_data, first_post_date
+
+
+def fast_extract_posts(text, first_post_date):
+    return extract_posts(parse_html(text), first_post_date)
+
+
+def time_per_page(function, pages):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for text in pages:
+            function(text, None)
+    return (time.perf_counter() - start) / (REPEAT * len(pages))
+
+
+def main():
+    names = sorted(name for name in os.listdir(FIXTURES_DIR) if name.startswith('thread_page'))
+    pages = []
+    for name in names:
+        with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+            pages.append(f.read())
+
+    # Field-for-field comparison before timing anything
+    for name, text in zip(names, pages):
+        legacy = legacy_extract_posts(text, None)
+        fast = fast_extract_posts(text, None)
+        if legacy != fast:
+            for legacy_post, fast_post in zip(legacy[0], fast[0]):
+                for field in legacy_post:
+                    if legacy_post[field] != fast_post[field]:
+                        print(f"{name}: {field} differs\n  legacy: {legacy_post[field]!r}\n  fast:   {fast_post[field]!r}")
+                        break
+            sys.exit(f"Extraction output differs on {name}")
+        print(f"{name}: {len(fast[0])} posts identical")
+
+    legacy_time = time_per_page(legacy_extract_posts, pages)
+    fast_time = time_per_page(fast_extract_posts, pages)
+    print(f"BeautifulSoup/html.parser: {legacy_time * 1000:.2f} ms per page")
+    print(f"lxml single pass:          {fast_time * 1000:.2f} ms per page")
+    print(f"Speedup: {legacy_time / fast_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
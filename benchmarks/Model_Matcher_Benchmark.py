@@ -0,0 +1,94 @@
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Model_Matcher import ModelMatcher
+from Post_Extraction import extract_posts, parse_html
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+REPEAT = 20
+
+# The per-pattern regexes the crawler used before model_catalogue.json, kept as the reference
+legacy_model_patterns = {
+    'iMOW 5 EVO': r'\bimow\s*5\s*evo\b',
+    'iMOW 6 EVO': r'\bimow\s*6\s*evo\b',
+    'iMOW 7 EVO': r'\bimow\s*7\s*evo\b|\bimow7evo\b|\bmower\s*7\s*evo\b|\bevo\s*7\b',
+    'iMOW 4': r'\bimow\s*4\b(?!\s*evo)',
+    'iMOW 5': r'\bimow\s*5\b(?!\s*evo)',
+    'iMOW 6': r'\bimow\s*6\b(?!\s*evo)',
+    'iMOW 7': r'\bimow\s*7\b(?!\s*evo)',
+    'iMOW 422': r'\bimow\s*422\b',
+    'iMOW 522': r'\bimow\s*522\b',
+    'iMOW 632': r'\bimow\s*632\b',
+}
+
+legacy_combined_patterns = [
+    r'\bimow\s*5\s*(,|/| and |&|\s)*6\s*(,|/| and |&|\s)*7\b',
+    r'\bimow\s*5\s*-\s*7\b',
+    r'\bimow\s*5-7\b',
+]
+
+
+def legacy_extract_models(text):
+    found_models = set()
+    text = text.lower()
+    for model, pattern in legacy_model_patterns.items():
+        if re.search(pattern, text):
+            found_models.add(model)
+    for pattern in legacy_combined_patterns:
+        if re.search(pattern, text):
+            found_models.update(['iMOW 4', 'iMOW 5', 'iMOW 6', 'iMOW 7', 'iMOW 5 EVO', 'iMOW 6 EVO', 'iMOW 7 EVO'])
+            break
+    return found_models
+
+
+# Post texts from the fixtures plus random sentences built from the words the aliases are made of
+def load_texts():
+    texts = []
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.startswith('thread_page'):
+            with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+                posts_data, _ = extract_posts(parse_html(f.read()), None)
+            texts.extend(post['post_content'] for post in posts_data)
+
+    random.seed(3)
+    tokens = ['imow', 'iMOW', '5', '6', '7', '4', '422', '522', '632', 'evo', 'EVO', 'mower', 'imow7evo',
+              'and', '&', '/', ',', '-', '5-7', 'der', 'Mäher', 'Messer', 'Rasen']
+    for _ in range(5000):
+        texts.append(' '.join(random.choice(tokens) for _ in range(random.randint(1, 12))))
+    return texts
+
+
+def main():
+    matcher = ModelMatcher()
+    texts = load_texts()
+
+    for text in texts:
+        if legacy_extract_models(text) != matcher.extract(text):
+            sys.exit(f"Model detection differs on {text!r}")
+    print(f"{len(texts)} texts: identical models")
+
+    # One large body of forum text, like the first post of a long thread or a whole thread joined
+    corpus = ' '.join(texts[:200]) * 50
+    timings = {}
+    for label, function in (('per-pattern re.search', legacy_extract_models), ('ModelMatcher', matcher.extract)):
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            function(corpus)
+        timings[label] = (time.perf_counter() - start) / REPEAT
+
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        timings[label + ' (short posts)'] = time.perf_counter() - start
+
+    for label, seconds in timings.items():
+        print(f"{label:40s} {seconds * 1000:.2f} ms")
+    print(f"Large text ({len(corpus) / 1e6:.1f} MB): {len(matcher.find(corpus))} mentions with spans")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import NLP
+import Web_Crawling
+from Analysis_Store import AnalysisStore
+from Crawl_Metrics import CrawlMetrics
+from Crawl_State import CrawlState
+from Post_Extraction import post_number
+from Post_Store import PostStore
+from Site_Adapters import make_adapter
+from Translation import StubBackend, Translator
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offline_baseline.json')
+
+# Size and cost of the run, a baseline is only compared with runs of the same settings
+SETTINGS = {
+    'listing_pages': 4,  # Listing pages served, each lists THREADS_PER_PAGE threads of 3 fixture pages
+    'server_latency': 0.0,  # Seconds the forum stand-in waits before every answer
+    'translation_latency': 0.02,  # Seconds of every call to the fake translator (one per thread page)
+    'model_latency': 0.002,  # Seconds per text of the stand-in models
+    'dedup': False,  # The fixture threads repeat the same posts, so the index would merge nearly all of them
+}
+# Threads on every fixture listing page and posts of the three fixture thread pages together
+THREADS_PER_PAGE = 20
+POSTS_PER_THREAD = 56
+# A stage counts as slower than the baseline above this factor
+TOLERANCE = 1.1
+
+
+# Stand-in for the forum: serves the fixture pages for every listing and thread URL
+#
+# The fixtures are synthetic: XenForo markup as roboter-forum.com serves it (quotes, nested quotes, code
+# and spoiler blocks, links, signatures, reactions) filled with German forum vocabulary, not recorded
+# pages. Listing page N is a fixture listing page with its thread ids moved up by 40 for every second page,
+# so each page lists new threads. The last-page link points to listing_pages, other page links past it are
+# dropped. Every thread has the three fixture thread pages.
+class ForumHandler(BaseHTTPRequestHandler):
+    pages = {}
+    listing_pages = 2
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        text = self.page(self.path)
+        if text is None:
+            self.send_error(404)
+            return
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def page(self, path):
+        match = re.fullmatch(r'/forums/[^/]+/(?:page-(\d+))?', path)
+        if match:
+            number = int(match.group(1) or 1)
+            if number > self.listing_pages:
+                return None
+            text = self.pages[f'forum_listing_page_{2 - number % 2}']
+            offset = 40 * ((number - 1) // 2)
+            text = re.sub(r'\b700(\d\d)\b', lambda id_match: str(70000 + offset + int(id_match.group(1))), text)
+            last_page = max(int(page) for page in re.findall(r'<a href="[^"]*/page-\d+">(\d+)</a>', text))
+            return re.sub(r'<a href="([^"]*/page-)\d+">(\d+)</a>',
+                          lambda link: self.page_link(link, last_page), text)
+        match = re.fullmatch(r'/threads/[^/]+/(?:page-(\d+))?', path)
+        if match:
+            return self.pages.get(f'thread_page_{match.group(1) or 1}')
+        return None
+
+    def page_link(self, link, last_page):
+        number = int(link.group(2))
+        if number == last_page:
+            return f'<a href="{link.group(1)}{self.listing_pages}">{self.listing_pages}</a>'
+        return '' if number > self.listing_pages else link.group(0)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_forum(settings):
+    ForumHandler.pages = {}
+    for name in os.listdir(FIXTURES_DIR):
+        with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+            ForumHandler.pages[os.path.splitext(name)[0]] = f.read()
+    ForumHandler.listing_pages = settings['listing_pages']
+    ForumHandler.latency = settings['server_latency']
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ForumHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Tiny deterministic stand-ins for the Hugging Face models, with the outputs of Inference_Backends
+#
+# Scores come from a hash of the text and the label, so every run gives the same labels, and every text
+# costs latency seconds like a model would.
+class StandInBackend:
+    name = 'standin'
+    emotion_labels = ['anger', 'disgust', 'fear', 'joy', 'neutral', 'sadness', 'surprise']
+    revisions = {'zero_shot': 'standin', 'emotion': 'standin'}
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def scores(self, text, labels):
+        logits = np.array([int.from_bytes(hashlib.sha256(f'{label}\0{text}'.encode('utf-8')).digest()[:4], 'big')
+                           for label in labels]) / 2 ** 30
+        scores = np.exp(logits) / np.exp(logits).sum()
+        order = np.argsort(-scores, kind='stable')
+        return [labels[index] for index in order], [float(scores[index]) for index in order]
+
+    def zero_shot(self, texts, labels):
+        time.sleep(self.latency * len(texts))
+        results = []
+        for text in texts:
+            ordered_labels, scores = self.scores(text, labels)
+            results.append({'sequence': text, 'labels': ordered_labels, 'scores': scores})
+        return results
+
+    def emotions(self, texts):
+        time.sleep(self.latency * len(texts))
+        results = []
+        for text in texts:
+            ordered_labels, scores = self.scores(text, self.emotion_labels)
+            results.append([{'label': label, 'score': score} for label, score in zip(ordered_labels, scores)])
+        return results
+
+
+# Hash of rows that does not depend on the host, the order of the rows or of joined sets
+def fingerprint(rows):
+    canonical = []
+    for row in rows:
+        values = {}
+        for column, value in row.items():
+            if column == 'thread_url' and value:
+                value = urlsplit(value).path
+            elif isinstance(value, str):
+                value = ', '.join(sorted(value.split(', ')))
+            elif isinstance(value, float):
+                value = round(value, 6)
+            values[column] = value
+        canonical.append(json.dumps(values, sort_keys=True, default=str, ensure_ascii=False))
+    return hashlib.sha256('\n'.join(sorted(canonical)).encode('utf-8')).hexdigest()
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+# Crawl of the forum stand-in through Web_Crawling.scrape_sites, with the fake translator
+def run_crawl(work_dir, forum_url, settings, stages, outputs):
+    Web_Crawling.requests_per_second = 10000.0
+    Web_Crawling.request_burst = 10000
+    Web_Crawling.dedup_index_file = os.path.join(work_dir, 'dedup_index.sqlite') if settings['dedup'] else None
+    Web_Crawling._dedup_index = None
+    Web_Crawling._translator = Translator(StubBackend(latency=settings['translation_latency']))
+
+    adapters = [make_adapter({'engine': 'xenforo', 'forum_url': forum_url, 'platform': 'roboter-forum.com'})]
+    crawl_state = CrawlState(os.path.join(work_dir, 'crawl_state.json'))
+    store = PostStore(os.path.join(work_dir, 'crawl_store.sqlite'))
+    metrics = CrawlMetrics()
+    rows_added, stages['crawl'] = timed(Web_Crawling.scrape_sites, adapters, crawl_state, store, metrics)
+
+    # Summed over calls, several threads run at the same time
+    snapshot = metrics.snapshot()
+    for stage, totals in snapshot['stages'].items():
+        stages[f'crawl {stage}'] = totals['seconds']
+    stages['crawl requests'] = sum(host['latency_seconds_sum'] for host in snapshot['hosts'].values())
+    posts = store.posts_after(0)
+    outputs['crawl'] = fingerprint([{key: value for key, value in post.items() if key != 'id'} for post in posts])
+    return store, posts, rows_added
+
+
+def run_extract_models(posts, stages, outputs):
+    texts = [post['thread_title'] or '' for post in posts] + [post['post_content'] or '' for post in posts]
+    found, stages['extract_models'] = timed(lambda: [sorted(Web_Crawling.extract_models(text)) for text in texts])
+    outputs['extract_models'] = fingerprint([{'text': text, 'models': models} for text, models in zip(texts, found)])
+
+
+# categorize_comments with the stand-in models, its stages come from NLP_Metrics
+def run_categorize(work_dir, posts, settings, stages, outputs):
+    backend = StandInBackend(settings['model_latency'])
+    NLP._backend = backend
+    NLP.inference_backend = backend.name
+    NLP.inference_cache_file = None
+    NLP._inference_cache = None
+    NLP.dedup_index_file = os.path.join(work_dir, 'dedup_index.sqlite') if settings['dedup'] else None
+    NLP._dedup_index = None
+    NLP.cascade_model_file = None
+    NLP._cascade = None
+
+    # The crawl finishes threads in any order, the models see the posts in a fixed one
+    posts = sorted(posts, key=lambda post: (urlsplit(post['thread_url']).path,
+                                            post_number(post['post_sequence']) or 0))
+    metrics = NLP.new_metrics()
+    categorized_data, stages['categorize_comments'] = timed(NLP.categorize_comments, posts, metrics)
+    for stage, totals in metrics.snapshot()['stages'].items():
+        if stage != 'batch':
+            stages[f'categorize {stage}'] = totals['seconds']
+    outputs['categorize_comments'] = fingerprint(categorized_data)
+    for post, row in zip(posts, categorized_data):
+        row['post_id'] = post['id']
+    return categorized_data
+
+
+def run_excel(work_dir, store, categorized_data, stages):
+    posts_file = os.path.join(work_dir, 'Web Crawled.xlsx')
+    analysis_file = os.path.join(work_dir, 'NLP Analysis.xlsx')
+    analysis_store = AnalysisStore(os.path.join(work_dir, 'nlp_store.sqlite'))
+    analysis_store.commit_batch(categorized_data, max(row['post_id'] for row in categorized_data))
+    # The exports print a line each
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, stages['excel export posts'] = timed(store.export_excel, posts_file,
+                                                os.path.join(work_dir, 'modelCrawled.xlsx'))
+        _, stages['excel read posts'] = timed(pd.read_excel, posts_file)
+        _, stages['excel export analysis'] = timed(analysis_store.export_excel, analysis_file)
+    analysis_store.close()
+
+
+def run(settings):
+    stages = {}
+    outputs = {}
+    server = start_forum(settings)
+    forum_url = f'http://127.0.0.1:{server.server_address[1]}/forums/imow-5-6-7-evo.255/'
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as work_dir:
+        start = time.perf_counter()
+        store, posts, rows_added = run_crawl(work_dir, forum_url, settings, stages, outputs)
+        run_extract_models(posts, stages, outputs)
+        categorized_data = run_categorize(work_dir, posts, settings, stages, outputs)
+        run_excel(work_dir, store, categorized_data, stages)
+        store.close()
+        total = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+
+    return {
+        'settings': settings,
+        'posts': rows_added,
+        'stages': {stage: round(seconds, 4) for stage, seconds in stages.items()},
+        'throughput': {
+            'crawl_posts_per_second': round(rows_added / stages['crawl'], 1),
+            'categorize_posts_per_second': round(len(posts) / stages['categorize_comments'], 1),
+            'end_to_end_posts_per_second': round(rows_added / total, 1),
+        },
+        'outputs': outputs,
+    }
+
+
+# Prints the stages next to the baseline; returns False when an output changed
+def compare(result, baseline):
+    if baseline['settings'] != result['settings']:
+        print(f"The baseline was taken with {baseline['settings']}, timings are not comparable")
+        return True
+    print(f"{'stage':<30}{'baseline s':>12}{'now s':>12}{'speedup':>10}")
+    for stage, seconds in result['stages'].items():
+        before = baseline['stages'].get(stage)
+        if before is None:
+            print(f"{stage:<30}{'-':>12}{seconds:>12.4f}")
+            continue
+        speedup = before / seconds if seconds else float('inf')
+        note = '  slower' if seconds > before * TOLERANCE else ''
+        print(f"{stage:<30}{before:>12.4f}{seconds:>12.4f}{speedup:>9.2f}x{note}")
+    for name, value in result['throughput'].items():
+        print(f"{name}: {baseline['throughput'].get(name)} -> {value}")
+
+    changed = [name for name, value in result['outputs'].items() if baseline['outputs'].get(name) != value]
+    for name in changed:
+        print(f"Output of {name} differs from the baseline")
+    return not changed
+
+
+def main():
+    # Only warnings, the crawl logs every thread and batch at INFO
+    logging.getLogger().setLevel(logging.WARNING)
+    result = run(dict(SETTINGS))
+    print(f"{result['posts']} posts crawled from the forum stand-in")
+    expected_posts = SETTINGS['listing_pages'] * THREADS_PER_PAGE * POSTS_PER_THREAD
+    if result['posts'] != expected_posts:
+        sys.exit(f"Expected {expected_posts} posts from {SETTINGS['listing_pages']} listing pages, the crawl missed some")
+
+    if '--save' in sys.argv[1:]:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(result, f, indent=2)
+        for stage, seconds in result['stages'].items():
+            print(f"{stage:<30}{seconds:>12.4f}")
+        print(f"Saved the baseline to {BASELINE_FILE}")
+        return
+    if not os.path.exists(BASELINE_FILE):
+        print(json.dumps(result, indent=2))
+        print("No baseline yet, save one with --save")
+        return
+    with open(BASELINE_FILE, 'r') as f:
+        baseline = json.load(f)
+    if not compare(result, baseline):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
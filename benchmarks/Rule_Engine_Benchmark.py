@@ -0,0 +1,153 @@
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Post_Extraction import extract_posts, parse_html
+from Rule_Engine import RuleEngine
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+POSTS = 20000
+
+# The keyword tables and per-post loop categorize_comments used before nlp_rules.json, kept as the reference
+technical_keywords = {
+    "blades": r"\b(?:blade|blades|knive|knives)\b",
+    "hardware": r"\b(?:dock|docking station|spare parts|wheel|wheels|tire|tyre|rotation|motor)\b",
+    "connectivity": r"\b(?:server|mobile network|WLAN|GPS|Bluetooth|connectivity)\b",
+    "software": r"\b(?:software version|standard settings|driving functions|functions)\b",
+    "installation": r"\b(?:mowing time|install|installation|guide wire|boundary wire)\b",
+    "design": r"\b(?:deck|design)\b",
+    "app": r"\b(?:app|application|mobile app|software app|iMOW app)\b"
+}
+countries = ["Germany", "UK", "Russia", "China", "India", "Italy", "Brazil", "USA", "Czech Republic", "Austria"]
+imow_models = {
+    'iMOW 7 EVO': r'\bstihl\s*imow\s*7\s*evo\b|\bstihl\s*imow7evo\b|\bstihl\s*mower\s*7\s*evo\b|\bevo\s*7\b',
+    'iMOW 7': r'\bstihl\s*imow\s*7\b|\bstihl\s*imow7\b|\bstihl\s*mower\s*7\b|\biMOW\s*7\b',
+    'iMOW 6 EVO': r'\bstihl\s*imow\s*6\s*evo\b|\bstihl\s*imow6evo\b|\bstihl\s*mower\s*6\s*evo\b|\bevo\s*6\b',
+    'iMOW 6': r'\bstihl\s*imow\s*6\b|\bstihl\s*imow6\b|\bstihl\s*mower\s*6\b|\biMOW\s*6\b',
+    'iMOW 5 EVO': r'\bstihl\s*imow\s*5\s*evo\b|\bstihl\s*imow5evo\b|\bstihl\s*mower\s*5\s*evo\b|\bevo\s*5\b',
+    'iMOW 5': r'\bstihl\s*imow\s*5\b|\bstihl\s*imow5\b|\bstihl\s*mower\s*5\b|\biMOW\s*5\b',
+    'iMOW 4': r'\bstihl\s*imow\s*4\b|\bstihl\s*imow4\b|\bstihl\s*mower\s*4\b|\biMOW\s*4\b',
+    'iMOW 522': r'\bstihl\s*imow\s*522\b|\bstihl\s*mower\s*522\b|\biMOW\s*522\b|\biMOW\s*522C\b|\biMOW\s*522PC\b',
+    'iMOW 422': r'\bstihl\s*imow\s*422\b|\bstihl\s*mower\s*422\b|\biMOW\s*422\b|\biMOW\s*422C\b|\biMOW\s*422PC\b',
+    'iMOW 632': r'\bstihl\s*imow\s*632\b|\bstihl\s*mower\s*632\b|\biMOW\s*632\b|\biMOW\s*632C\b|\biMOW\s*632PC\b',
+    'STIHL automower': r'\bstihl\s*automower\b',
+    'STIHL robot': r'\bstihl\s*robot\b',
+    'STIHL mower': r'\bstihl\s*mower\b',
+    'STIHL robot mower': r'\bstihl\s*robot\s*mower\b',
+    'STIHL iMOW': r'\bstihl\s*imow\b',
+    'STIHL mower robot': r'\bstihl\s*mower\s*robot\b',
+    'STIHL robotic mower': r'\bstihl\s*robotic\s*mower\b'
+}
+emotion_keywords = {
+    "anticipation": ["curiosity", "excited", "positive attitude", "hopeful", "possibility", "urgency", "forward thinking"],
+    "frustration": ["frustration", "errors", "system", "angry", "disgusted", "disappointment"],
+    "inquiry": ["solution", "request", "information", "question", "wondering", "gratitude"],
+    "preference": ["desired outcome", "suggestions", "feature request", "improvement", "replacement", "old models", "old software", "old technology"],
+    "suggestive": ["sharing information", "sharing tools", "sharing experience", "suggestions", "helpful"],
+    "satisfied": ["happy", "joy", "joyful", "excited"]
+}
+
+
+def detect_keywords_with_matches(text, patterns):
+    detected = []
+    matches = []
+    for key, pattern in patterns.items():
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            detected.append(key)
+            matches.append(match.group(0))
+    return detected, matches
+
+
+def detect_keywords(text, patterns):
+    detected = []
+    for key, pattern in patterns.items():
+        if re.search(pattern, text, re.IGNORECASE):
+            detected.append(key)
+    return detected
+
+
+def legacy_rules(post_content):
+    detected_technical_issues, keyword_matches = detect_keywords_with_matches(post_content, technical_keywords)
+    emotion = None
+    for candidate, keywords in emotion_keywords.items():
+        if any(keyword in post_content for keyword in keywords):
+            emotion = candidate
+            break
+    detected_countries = [country for country in countries if country.lower() in post_content]
+    detected_imow_models = detect_keywords(post_content, imow_models)
+    questions = []
+    if any(word in post_content for word in ["what", "why", "how", "where", "when", "which"]):
+        if re.search(technical_keywords["hardware"], post_content):
+            questions.append("hardware")
+        elif re.search(technical_keywords["connectivity"], post_content):
+            questions.append("connectivity")
+        elif re.search(technical_keywords["installation"], post_content):
+            questions.append("installation")
+        elif re.search(technical_keywords["software"], post_content):
+            questions.append("software")
+        else:
+            questions.append("general")
+    solution = any(word in post_content for word in ["solution", "resolved", "fix", "answer"])
+    replaced = any(word in post_content for word in ["updated", "changed", "replaced", "alternative"])
+    comparison = any(word in post_content for word in ["comparison", "updated", "alternative"])
+    complaint = any(word in post_content for word in ["angry", "issue", "problem", "complaint"])
+    return (detected_technical_issues, keyword_matches, emotion, detected_countries, detected_imow_models,
+            questions, solution, replaced, comparison, complaint)
+
+
+def engine_rules(results, index):
+    question = results['questions'][index]
+    return (results['technical_keywords'][index], results['technical_keywords_matches'][index],
+            results['emotions'][index], results['countries'][index], results['imow_models'][index],
+            [question] if question else [], bool(results['solution'][index]), bool(results['replaced'][index]),
+            bool(results['comparison'][index]), bool(results['complaints'][index]))
+
+
+# Lowercased post texts from the fixtures plus random posts built from the words the rules look for
+def load_texts():
+    texts = []
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.startswith('thread_page'):
+            with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+                posts_data, _ = extract_posts(parse_html(f.read()), None)
+            texts.extend(post['post_content'].lower() for post in posts_data)
+
+    random.seed(5)
+    words = ['the', 'mower', 'is', 'great', 'but', 'my', 'garden', 'lawn', 'today', 'really', 'after', 'rain',
+             'what', 'how', 'blade', 'wheel', 'gps', 'wlan', 'install', 'guide wire', 'app', 'design', 'stihl imow 6',
+             'imow 5', 'evo 7', 'stihl robot mower', 'germany', 'uk', 'problem', 'fix', 'updated', 'happy', 'system',
+             'functions', 'software version', 'server', 'austria', 'suggestions', 'question', 'knives']
+    while len(texts) < POSTS:
+        # Most posts are plain chatter, a few mention the things the rules look for
+        vocabulary = words[:12] if random.random() < 0.7 else words
+        texts.append(' '.join(random.choice(vocabulary) for _ in range(random.randint(3, 60))))
+    return texts
+
+
+def main():
+    engine = RuleEngine()
+    texts = load_texts()
+
+    start = time.perf_counter()
+    legacy = [legacy_rules(text) for text in texts]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = engine.evaluate(texts)
+    engine_time = time.perf_counter() - start
+
+    for index, text in enumerate(texts):
+        if legacy[index] != engine_rules(results, index):
+            sys.exit(f"Rules differ on {text!r}\n  legacy: {legacy[index]}\n  engine: {engine_rules(results, index)}")
+    print(f"{len(texts)} posts: identical rule columns")
+    print(f"Per-post loop: {legacy_time * 1000:.1f} ms")
+    print(f"RuleEngine:    {engine_time * 1000:.1f} ms")
+    print(f"Speedup: {legacy_time / engine_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()